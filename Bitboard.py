@@ -0,0 +1,241 @@
+import functools
+import random
+
+GRID_SIZE = 10
+
+def cell_index(position : list[int, int] | tuple[int, int], grid_size : int = GRID_SIZE) -> int | None:
+    row, col = int(position[0]), int(position[1])
+    if not (0 <= row < grid_size and 0 <= col < grid_size): return None
+    return row * grid_size + col
+
+def index_cell(index : int, grid_size : int = GRID_SIZE) -> tuple[int, int]:
+    return divmod(index, grid_size)
+
+def mask_cells(mask : int, grid_size : int = GRID_SIZE) -> list[tuple[int, int]]:
+    """
+    Turns a mask back into the (row, col) of each of its cells, lowest bit first
+    """
+    cells = []
+    while mask:
+        lowest_bit = mask & -mask
+        cells.append(divmod(lowest_bit.bit_length() - 1, grid_size))
+        mask ^= lowest_bit
+    return cells
+
+class Board:
+    """
+    A player's fleet and the shots fired at it, stored as integer bitmasks with one bit per cell
+    """
+    def __init__(self, ships : list[list[list[int, int]]], grid_size : int = GRID_SIZE):
+        self.grid_size = grid_size
+        self.ship_masks : list[int] = []
+        #which ship sits on each cell, numbered from 1 so that 0 is open water
+        self.ship_at = bytearray(grid_size * grid_size)
+        self.occupied = 0
+        for ship_number, ship in enumerate(ships):
+            ship_mask = 0
+            for location in ship:
+                index = cell_index(location, grid_size)
+                if index == None: continue
+                ship_mask |= 1 << index
+                self.ship_at[index] = ship_number + 1
+            self.ship_masks.append(ship_mask)
+            self.occupied |= ship_mask
+        self.hits = 0
+        self.misses = 0
+        self.__just_sunk : int | None = None
+
+    def shoot(self, position : list[int, int]) -> int:
+        index = cell_index(position, self.grid_size)
+        if index == None: return 1 # shots off the board always miss
+        bit = 1 << index
+        if not self.occupied & bit:
+            self.misses |= bit
+            return 1 # the result was a miss
+        if not self.hits & bit:
+            self.hits |= bit
+            ship_number = self.ship_at[index] - 1
+            if self.ship_masks[ship_number] & ~self.hits == 0: self.__just_sunk = ship_number
+        return 2 # the result was a hit
+
+    def ship_cells(self, ship_number : int) -> list[tuple[int, int]]:
+        return mask_cells(self.ship_masks[ship_number], self.grid_size)
+
+    def fleet_cells(self) -> list[list[tuple[int, int]]]:
+        return [mask_cells(ship_mask, self.grid_size) for ship_mask in self.ship_masks]
+
+    def sunk_ships(self) -> list[list[tuple[int, int]]]:
+        return [mask_cells(ship_mask, self.grid_size) for ship_mask in self.ship_masks if ship_mask & ~self.hits == 0]
+
+    def hit_cells(self) -> list[tuple[int, int]]:
+        return mask_cells(self.hits, self.grid_size)
+
+    def miss_cells(self) -> list[tuple[int, int]]:
+        return mask_cells(self.misses, self.grid_size)
+
+    def pop_sunk_ship(self) -> list[tuple[int, int]] | None:
+        """
+        Returns the cells of the ship sunk by the last shot, if there was one, only once
+        """
+        ship_number, self.__just_sunk = self.__just_sunk, None
+        if ship_number == None: return None
+        return self.ship_cells(ship_number)
+
+    def destroyed(self) -> bool:
+        return self.occupied & ~self.hits == 0
+
+class SparseBoard:
+    """
+    The same as Board, for boards too big for a bit per cell. Only the cells with a ship or a shot on them are stored, by index,
+    so a huge board costs no more than a small one with the same fleet
+    """
+    def __init__(self, ships : list[list[list[int, int]]], grid_size : int = GRID_SIZE):
+        self.grid_size = grid_size
+        self.ships : list[list[int]] = []
+        #which ship sits on each occupied cell
+        self.ship_at : dict[int, int] = {}
+        for ship_number, ship in enumerate(ships):
+            cells = []
+            for location in ship:
+                index = cell_index(location, grid_size)
+                if index == None: continue
+                cells.append(index)
+                self.ship_at[index] = ship_number
+            self.ships.append(cells)
+        self.hits : set[int] = set()
+        self.misses : set[int] = set()
+        #cells of each ship that haven't been hit yet, and of the whole fleet
+        self.afloat = [len(cells) for cells in self.ships]
+        self.cells_afloat = sum(self.afloat)
+        self.__just_sunk : int | None = None
+
+    def shoot(self, position : list[int, int]) -> int:
+        index = cell_index(position, self.grid_size)
+        if index == None: return 1 # shots off the board always miss
+        ship_number = self.ship_at.get(index)
+        if ship_number == None:
+            self.misses.add(index)
+            return 1 # the result was a miss
+        if index not in self.hits:
+            self.hits.add(index)
+            self.afloat[ship_number] -= 1
+            self.cells_afloat -= 1
+            if self.afloat[ship_number] == 0: self.__just_sunk = ship_number
+        return 2 # the result was a hit
+
+    def ship_cells(self, ship_number : int) -> list[tuple[int, int]]:
+        return [index_cell(index, self.grid_size) for index in self.ships[ship_number]]
+
+    def fleet_cells(self) -> list[list[tuple[int, int]]]:
+        return [self.ship_cells(ship_number) for ship_number in range(len(self.ships))]
+
+    def sunk_ships(self) -> list[list[tuple[int, int]]]:
+        return [self.ship_cells(ship_number) for ship_number, afloat in enumerate(self.afloat) if afloat == 0]
+
+    def hit_cells(self) -> list[tuple[int, int]]:
+        return [index_cell(index, self.grid_size) for index in self.hits]
+
+    def miss_cells(self) -> list[tuple[int, int]]:
+        return [index_cell(index, self.grid_size) for index in self.misses]
+
+    def pop_sunk_ship(self) -> list[tuple[int, int]] | None:
+        """
+        Returns the cells of the ship sunk by the last shot, if there was one, only once
+        """
+        ship_number, self.__just_sunk = self.__just_sunk, None
+        if ship_number == None: return None
+        return self.ship_cells(ship_number)
+
+    def destroyed(self) -> bool:
+        return self.cells_afloat == 0
+
+AnyBoard = Board | SparseBoard
+
+def new_board(ships : list[list[list[int, int]]], grid_size : int = GRID_SIZE) -> AnyBoard:
+    """
+    A board for the fleet, as bitmasks unless the grid is big enough that every shot would copy a huge integer
+    """
+    if grid_size <= PLACEMENT_TABLE_MAX_GRID: return Board(ships, grid_size)
+    return SparseBoard(ships, grid_size)
+
+FLEET = [2, 3, 3, 4, 5]
+#past this a table of every placement takes more memory than checking each ship directly, and a mask per board costs more than a set of cells
+PLACEMENT_TABLE_MAX_GRID = 32
+
+@functools.lru_cache(maxsize=None)
+def placements(length : int, grid_size : int = GRID_SIZE) -> tuple[tuple[int, tuple[int, ...]], ...]:
+    """
+    Every straight line a ship of this length can sit on, as its mask and the index of each of its cells
+    """
+    lines = []
+    for row in range(grid_size):
+        for col in range(grid_size):
+            for row_step, col_step in ((0, 1), (1, 0)):
+                if row + row_step * (length - 1) >= grid_size or col + col_step * (length - 1) >= grid_size: continue
+                #a ship of length 1 is the same line both ways
+                if length == 1 and row_step: continue
+                cells = tuple((row + row_step * i) * grid_size + col + col_step * i for i in range(length))
+                lines.append((sum(1 << cell for cell in cells), cells))
+    return tuple(lines)
+
+@functools.lru_cache(maxsize=None)
+def placement_masks(length : int, grid_size : int = GRID_SIZE) -> frozenset[int]:
+    return frozenset(ship_mask for ship_mask, cells in placements(length, grid_size))
+
+def _coordinate(value) -> int:
+    #the client works cells out by dividing pixel positions, so whole numbers can arrive as floats
+    if type(value) == int: return value
+    if type(value) == float and value.is_integer(): return int(value)
+    raise ValueError(f"{value!r} isn't a whole number")
+
+def validate_fleet(ships, grid_size : int = GRID_SIZE, fleet : list[int] = FLEET) -> list[list[list[int, int]]]:
+    """
+    Checks that ships is exactly the fleet, each ship on the board in a straight unbroken line and none of them overlapping,
+    and returns it with every coordinate as an int. Raises ValueError saying what's wrong otherwise
+    """
+    if type(ships) != list or len(ships) != len(fleet): raise ValueError(f"a fleet has {len(fleet)} ships")
+    if sorted(len(ship) if type(ship) == list else -1 for ship in ships) != sorted(fleet): raise ValueError(f"the ships must be {sorted(fleet)} long")
+
+    occupied : set[int] = set()
+    checked = []
+    for ship in ships:
+        indices = []
+        cells = []
+        for cell in ship:
+            if type(cell) != list or len(cell) != 2: raise ValueError(f"{cell!r} isn't a [row, col] pair")
+            row, col = _coordinate(cell[0]), _coordinate(cell[1])
+            index = cell_index((row, col), grid_size)
+            if index == None: raise ValueError(f"{[row, col]} is off the board")
+            indices.append(index)
+            cells.append([row, col])
+        if not _straight_line(indices, grid_size): raise ValueError(f"{cells} isn't a straight unbroken line")
+        if not occupied.isdisjoint(indices): raise ValueError(f"{cells} overlaps another ship")
+        occupied.update(indices)
+        checked.append(cells)
+    return checked
+
+def _straight_line(indices : list[int], grid_size : int) -> bool:
+    #a ship with a repeated cell, a gap or a bend has a mask no straight line of its length has
+    if grid_size <= PLACEMENT_TABLE_MAX_GRID: return sum(1 << index for index in indices) in placement_masks(len(indices), grid_size)
+    #otherwise the cells have to be next to each other along a row, or a column, in order
+    indices = sorted(indices)
+    step = 1 if indices[0] // grid_size == indices[-1] // grid_size else grid_size
+    return all(following - index == step for index, following in zip(indices, indices[1:]))
+
+def random_fleet(grid_size : int = GRID_SIZE, fleet : list[int] = FLEET, rng : random.Random = random) -> list[list[list[int, int]]]:
+    """
+    Places each ship of the fleet in a random straight line, without any overlaps, in the same format clients send their ships in
+    """
+    occupied : set[int] = set()
+    ships = []
+    for length in fleet:
+        while True:
+            horizontal = rng.random() < 0.5
+            row = rng.randrange(grid_size if horizontal else grid_size - length + 1)
+            col = rng.randrange(grid_size - length + 1 if horizontal else grid_size)
+            cells = [[row, col + i] if horizontal else [row + i, col] for i in range(length)]
+            indices = [cell_index(cell, grid_size) for cell in cells]
+            if occupied.isdisjoint(indices): break
+        occupied.update(indices)
+        ships.append(cells)
+    return ships
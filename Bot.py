@@ -0,0 +1,173 @@
+import asyncio
+import random
+import sys
+import time
+from typing import Callable
+import websockets
+import Bitboard
+import Protocol
+import Strategy
+
+class BotStats:
+    """
+    What a group of bots saw while playing, shared between them so a load test can report on all of them at once
+    """
+    def __init__(self):
+        self.guess_latencies : list[float] = []
+        self.guesses = 0
+        self.matches_finished = 0
+        self.spectator_events = 0
+        self.errors : dict[str, int] = {}
+
+    def add_error(self, error : str):
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+class LocalConnection:
+    """
+    One end of a connection inside the server's own process, with the parts of a websocket the server and bots use
+    """
+    transport = None
+
+    def __init__(self, incoming : asyncio.Queue, outgoing : asyncio.Queue):
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.closed = False
+
+    async def send(self, message : str | bytes):
+        if self.closed: raise websockets.exceptions.ConnectionClosedOK(None, None)
+        self.outgoing.put_nowait(message)
+
+    async def recv(self) -> str | bytes:
+        message = await self.incoming.get()
+        if message == None:
+            self.incoming.put_nowait(None)
+            raise websockets.exceptions.ConnectionClosedOK(None, None)
+        return message
+
+    async def close(self, code : int = 1000, reason : str = ""):
+        #None wakes whatever is waiting on either end, and stays queued for anything that waits after it
+        if self.closed: return
+        self.closed = True
+        self.incoming.put_nowait(None)
+        self.outgoing.put_nowait(None)
+
+def local_pipe() -> tuple[LocalConnection, LocalConnection]:
+    to_server, to_bot = asyncio.Queue(), asyncio.Queue()
+    return LocalConnection(to_server, to_bot), LocalConnection(to_bot, to_server)
+
+async def play_match(uri : str, name : str = "Bot", protocol : str = Protocol.BINARY, stats : BotStats | None = None, rng : random.Random = random,
+                     on_welcome : Callable[[dict], None] | None = None, strategy : str = "random") -> int | None:
+    """
+    Connects to the server at uri and plays a whole match without a screen.
+    Returns 1 for a win, 0 for a loss, and None if the match ended any other way
+    """
+    async with websockets.connect(uri) as socket:
+        return await play(socket, name, protocol, stats, rng, on_welcome, strategy)
+
+async def play(socket : websockets.ClientConnection | LocalConnection, name : str = "Bot", protocol : str = Protocol.BINARY, stats : BotStats | None = None,
+               rng : random.Random = random, on_welcome : Callable[[dict], None] | None = None, strategy : str = "random", think_time : float = 0) -> int | None:
+    """
+    Plays a whole match over a connection that has just been opened, picking each shot with the named strategy from Strategy.py
+    """
+    stats = stats if stats else BotStats()
+    result = None
+
+    try:
+        welcome = Protocol.decode(await socket.recv())
+        if welcome["type"] != "welcome":
+            stats.add_error(str(welcome.get("message", welcome["type"])))
+            return None
+        players_turn = int(welcome["player"]) == 1
+        #servers from before boards could be resized don't say, and always use the standard board
+        grid_size = int(welcome.get("grid_size", Bitboard.GRID_SIZE))
+        fleet = list(welcome.get("fleet", Bitboard.FLEET))
+        shooter = Strategy.STRATEGIES[strategy](grid_size, fleet, rng)
+        if on_welcome: on_welcome(welcome)
+        chosen_protocol = protocol if protocol in (welcome.get("protocols") or []) else Protocol.JSON
+        #bots never come back after a dropped connection, so they don't ask for their seat to be held
+        features = [feature for feature in Protocol.SUPPORTED_FEATURES if feature != "resume"]
+        await socket.send(Protocol.encode({"type": "username", "name": name, "protocol": chosen_protocol, "features": features}))
+
+        #Wait for an opponent before placing the fleet, just like the real client
+        while (reply := Protocol.decode(await socket.recv()))["type"] != "username":
+            if reply["type"] == "ping": await socket.send(Protocol.encode({"type": "pong"}))
+            elif reply["type"] in ("error", "disconnection"):
+                stats.add_error(str(reply.get("message", reply["type"])))
+                return None
+        await socket.send(Protocol.encode({"type": "ships", "message": Bitboard.random_fleet(grid_size, fleet, rng)}))
+
+        guess_sent_at = None
+        while True:
+            if players_turn and (shot := shooter.next_shot()) != None:
+                if think_time: await asyncio.sleep(think_time)
+                #the match can end between our turn starting and the guess going out, the result is still waiting to be read
+                try: await socket.send(Protocol.encode({"type": "guess", "position": shot}, chosen_protocol))
+                except websockets.exceptions.ConnectionClosed: pass
+                else: guess_sent_at = time.perf_counter()
+                players_turn = False
+
+            reply = Protocol.decode(await socket.recv())
+            if reply["type"] in ("guess_result", "ship_sunk"):
+                if reply["type"] == "guess_result": shooter.record(reply["position"], reply["result"])
+                else: shooter.record_sunk(reply["cells"])
+                if guess_sent_at != None:
+                    stats.guess_latencies.append(time.perf_counter() - guess_sent_at)
+                    stats.guesses += 1
+                    guess_sent_at = None
+            elif reply["type"] in ("enemy_guess_result", "enemy_ship_sunk"):
+                players_turn = True
+            elif reply["type"] == "ping": await socket.send(Protocol.encode({"type": "pong"}))
+            elif reply["type"] == "done":
+                result = int(reply["result"])
+                stats.matches_finished += 1
+                break
+            else:
+                stats.add_error(str(reply.get("message", reply["type"])))
+                break
+        await socket.send(Protocol.encode({"type": "disconnection"}))
+    except websockets.exceptions.ConnectionClosed as e:
+        #the server closes the socket straight after a result, so that isn't an error
+        if result == None: stats.add_error(f"Connection closed: {e}")
+    return result
+
+async def spectate(uri : str, code : str, stats : BotStats | None = None) -> int | None:
+    """
+    Watches the match with the given code until it ends, rebuilding both boards from the snapshot and the events after it.
+    Returns the index of the winner, or None if nobody won
+    """
+    stats = stats if stats else BotStats()
+    boards : list[dict[tuple[int, int], int]] = [{}, {}]
+    async with websockets.connect(f"{uri.rstrip('/')}/{code}?spectate") as socket:
+        try:
+            snapshot = Protocol.decode(await socket.recv())
+            if snapshot["type"] != "spectate":
+                stats.add_error(str(snapshot.get("message", snapshot["type"])))
+                return None
+            for player, board in enumerate(snapshot["boards"]):
+                if board == None: continue
+                for cell in board["misses"]: boards[player][tuple(cell)] = 1
+                for cell in board["hits"]: boards[player][tuple(cell)] = 2
+                for ship in board["sunk"]:
+                    for cell in ship: boards[player][tuple(cell)] = 3
+
+            async for message in socket:
+                event = Protocol.decode(message)
+                stats.spectator_events += 1
+                #boards are kept by whose fleet they are, and events say who fired
+                if event["type"] == "guess_result": boards[1 - event["player"]][tuple(event["position"])] = event["result"]
+                elif event["type"] == "ship_sunk":
+                    for cell in event["cells"]: boards[1 - event["player"]][tuple(cell)] = 3
+                elif event["type"] == "done": return event["winner"]
+                elif event["type"] == "disconnection": return None
+        except websockets.exceptions.ConnectionClosed as e:
+            stats.add_error(f"Spectator connection closed: {e}")
+    return None
+
+if __name__ == "__main__":
+    #Play a single match as a bot, e.g. against someone using ShipWar.py
+    host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
+    port = sys.argv[2] if len(sys.argv) > 2 else "6363"
+    result = asyncio.run(play_match(f"ws://{host}:{port}"))
+    if result == 1: print("The bot won")
+    elif result == 0: print("The bot lost")
+    else: print("The match didn't finish")
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import time
+import Bot
+import Protocol
+
+def percentile(sorted_values : list[float], fraction : float) -> float:
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def run_load(uri : str, matches : int, protocol : str, ramp : float, spectators : int = 0) -> tuple[Bot.BotStats, float]:
+    """
+    Plays the given number of matches at the same time, two bots each, and returns what they saw and how long it took
+    """
+    stats = Bot.BotStats()
+    bots = []
+    def add_spectators(welcome : dict):
+        #only the first player in each match brings spectators along
+        if int(welcome["player"]) != 1: return
+        for i in range(spectators): bots.append(asyncio.create_task(Bot.spectate(uri, welcome["match"], stats)))
+
+    start = time.perf_counter()
+    for i in range(matches * 2):
+        bots.append(asyncio.create_task(Bot.play_match(uri, f"Bot {i}", protocol, stats, on_welcome=add_spectators)))
+        if ramp: await asyncio.sleep(ramp / (matches * 2))
+    #spectators get added to the list while it's being waited on
+    waited = 0
+    while waited < len(bots):
+        try: await bots[waited]
+        except Exception as e: stats.add_error(f"{type(e).__name__}: {e}")
+        waited += 1
+    return stats, time.perf_counter() - start
+
+def report(stats : Bot.BotStats, elapsed : float, matches : int):
+    latencies = sorted(stats.guess_latencies)
+    print(f"Matches: {stats.matches_finished // 2}/{matches} finished in {elapsed:.2f}s")
+    print(f"Guesses: {stats.guesses} ({stats.guesses / elapsed:.1f}/s)")
+    if stats.spectator_events: print(f"Spectator events: {stats.spectator_events} ({stats.spectator_events / elapsed:.1f}/s)")
+    print(f"Guess round trip: p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms, max {percentile(latencies, 1) * 1000:.2f}ms")
+    print(f"Errors: {sum(stats.errors.values())}")
+    for error, count in sorted(stats.errors.items(), key=lambda item: -item[1]):
+        print(f"  {count} x {error}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many bot matches against a ShipWar server at once and report how it held up")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6363)
+    parser.add_argument("--matches", type=int, default=50, help="how many matches to play at the same time")
+    parser.add_argument("--protocol", choices=Protocol.SUPPORTED_PROTOCOLS, default=Protocol.BINARY)
+    parser.add_argument("--spectators", type=int, default=0, help="how many spectators watch each match")
+    parser.add_argument("--ramp", type=float, default=0, help="seconds to spread the connections over, instead of opening them all at once")
+    args = parser.parse_args()
+
+    stats, elapsed = asyncio.run(run_load(f"ws://{args.host}:{args.port}", args.matches, args.protocol, args.ramp, args.spectators))
+    report(stats, elapsed, args.matches)
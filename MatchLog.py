@@ -0,0 +1,156 @@
+import mmap
+import os
+import struct
+import sys
+import time
+import Bitboard
+
+#event types
+MATCH_START = 1
+USERNAME = 2
+PLACEMENT = 3
+GUESS = 4
+RESULT = 5
+DISCONNECT = 6
+END = 7
+EVENT_NAMES = {MATCH_START: "match_start", USERNAME: "username", PLACEMENT: "placement", GUESS: "guess", RESULT: "result", DISCONNECT: "disconnect", END: "end"}
+
+#every record is this header followed by payload_length bytes of payload
+#event type, match id, time, player, payload length
+RECORD_HEADER = struct.Struct("!BIdBH")
+#the index file has a (match id, turn, offset in the log) for every record, turn 0 being everything before the first guess
+INDEX_ENTRY = struct.Struct("!IIQ")
+CELL = struct.Struct("!HH")
+NO_PLAYER = 255
+
+#a placement is the grid size and ship count, then each ship as its length followed by that many cells
+PLACEMENT_HEADER = struct.Struct("!HH")
+SHIP_LENGTH = struct.Struct("!H")
+
+def encode_placement(board : Bitboard.AnyBoard) -> bytes:
+    ships = board.fleet_cells()
+    return PLACEMENT_HEADER.pack(board.grid_size, len(ships)) + b"".join(SHIP_LENGTH.pack(len(cells)) + b"".join(CELL.pack(*cell) for cell in cells) for cells in ships)
+
+def decode_placement(payload : bytes) -> tuple[int, list[list[list[int]]]]:
+    grid_size, ship_count = PLACEMENT_HEADER.unpack_from(payload)
+    offset = PLACEMENT_HEADER.size
+    ships = []
+    for i in range(ship_count):
+        length = SHIP_LENGTH.unpack_from(payload, offset)[0]
+        offset += SHIP_LENGTH.size
+        ships.append([list(CELL.unpack_from(payload, offset + j * CELL.size)) for j in range(length)])
+        offset += length * CELL.size
+    return grid_size, ships
+
+class MatchLogWriter:
+    """
+    Appends match events to a binary log through a buffered file, and where each one went to an index beside it
+    """
+    def __init__(self, path : str, buffer_size : int = 64 * 1024):
+        self.path = path
+        self.log_file = open(path, "ab", buffering=buffer_size)
+        self.index_file = open(path + ".idx", "ab", buffering=buffer_size)
+        self.offset = self.log_file.tell()
+        self.turns : dict[int, int] = {}
+
+    def write(self, event : int, match_id : int, player : int = NO_PLAYER, payload : bytes = b""):
+        if event == GUESS: self.turns[match_id] = self.turns.get(match_id, 0) + 1
+        turn = self.turns.pop(match_id, 0) if event in (END, DISCONNECT) else self.turns.get(match_id, 0)
+        self.index_file.write(INDEX_ENTRY.pack(match_id, turn, self.offset))
+
+        record = RECORD_HEADER.pack(event, match_id, time.time(), player, len(payload)) + payload
+        self.log_file.write(record)
+        self.offset += len(record)
+
+    def flush(self):
+        self.log_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.log_file.close()
+        self.index_file.close()
+
+class MatchLogReader:
+    """
+    Reads a match log through a memory map, using its index to jump straight to any match and turn
+    """
+    def __init__(self, path : str):
+        self.path = path
+        self.__log_file = open(path, "rb")
+        size = os.fstat(self.__log_file.fileno()).st_size
+        self.log = mmap.mmap(self.__log_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        #match id -> offset of each of its records, and where in that list each turn starts
+        #anything past the end of the log never made it to disk
+        self.record_offsets : dict[int, list[int]] = {}
+        self.turn_starts : dict[int, list[int]] = {}
+        try:
+            with open(path + ".idx", "rb") as index_file: index = index_file.read()
+        except FileNotFoundError: index = b""
+        for match_id, turn, offset in INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]):
+            if offset >= size: continue
+            offsets = self.record_offsets.setdefault(match_id, [])
+            turn_starts = self.turn_starts.setdefault(match_id, [])
+            if turn == len(turn_starts): turn_starts.append(len(offsets))
+            offsets.append(offset)
+
+    def close(self):
+        if self.log: self.log.close()
+        self.__log_file.close()
+
+    def matches(self) -> list[int]:
+        return list(self.record_offsets)
+
+    def turns(self, match_id : int) -> int:
+        return len(self.turn_starts.get(match_id, [0])) - 1
+
+    def record_at(self, offset : int) -> tuple[dict, int]:
+        event, match_id, timestamp, player, length = RECORD_HEADER.unpack_from(self.log, offset)
+        start = offset + RECORD_HEADER.size
+        record = {"event": EVENT_NAMES.get(event, event), "match": match_id, "time": timestamp, "player": None if player == NO_PLAYER else player}
+        payload = self.log[start:start + length]
+        if event in (MATCH_START, USERNAME): record["text"] = payload.decode(errors="replace")
+        elif event == PLACEMENT: record["grid_size"], record["ships"] = decode_placement(payload)
+        elif event == GUESS: record["position"] = list(CELL.unpack_from(payload))
+        elif event == RESULT:
+            record["position"] = list(CELL.unpack_from(payload))
+            record["result"] = payload[CELL.size]
+            record["sunk"] = [list(cell) for cell in CELL.iter_unpack(payload[CELL.size + 1:])]
+        elif event == END: record["winner"] = payload[0]
+        return record, start + length
+
+    def events(self, match_id : int, from_turn : int = 0):
+        """
+        Yields the events of one match, starting at the given turn, until it ends
+        """
+        offsets = self.record_offsets.get(match_id)
+        if not offsets: return
+        turn_starts = self.turn_starts[match_id]
+        for offset in offsets[turn_starts[min(from_turn, len(turn_starts) - 1)]:]:
+            if offset + RECORD_HEADER.size > len(self.log): return
+            yield self.record_at(offset)[0]
+
+    def boards_at(self, match_id : int, turn : int) -> list[Bitboard.AnyBoard | None]:
+        """
+        Rebuilds both players' boards as they were just before the given turn
+        """
+        boards : list[Bitboard.AnyBoard | None] = [None, None]
+        turns_seen = 0
+        for record in self.events(match_id):
+            if record["event"] == "guess":
+                turns_seen += 1
+                if turns_seen >= turn: break
+            elif record["event"] == "placement":
+                boards[record["player"]] = Bitboard.new_board(record["ships"], record["grid_size"])
+            elif record["event"] == "result" and boards[1 - record["player"]] != None:
+                boards[1 - record["player"]].shoot(record["position"])
+        return boards
+
+if __name__ == "__main__":
+    #python MatchLog.py <log file> [match id] [turn]
+    reader = MatchLogReader(sys.argv[1])
+    if len(sys.argv) < 3:
+        for match_id in reader.matches(): print(f"Match {match_id}: {reader.turns(match_id)} turns")
+    else:
+        for record in reader.events(int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0): print(record)
+    reader.close()
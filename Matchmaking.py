@@ -0,0 +1,125 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import math
+import time
+from typing import Callable, Hashable
+
+DEFAULT_RATING = 1500
+#how far apart two players' ratings can be when they start waiting, and how much further for every second they wait
+INITIAL_WINDOW = 100
+WINDOW_GROWTH = 50
+
+class Ticket:
+    """
+    A player waiting in the queue, with whatever the server needs to seat them once they're paired
+    """
+    __slots__ = ("player", "rating", "bucket", "number", "joined_at", "queued")
+
+    def __init__(self, player, rating : float, bucket : Hashable, number : int, joined_at : float):
+        self.player = player
+        self.rating = rating
+        self.bucket = bucket
+        #breaks ties between equal ratings, so the queue never has to compare two tickets
+        self.number = number
+        self.joined_at = joined_at
+        self.queued = False
+
+class MatchmakingQueue:
+    """
+    Players waiting for an opponent, kept apart by bucket (the settings and region they asked for) and sorted by rating inside each one.
+    Someone arriving is checked against the nearest rating either side of them, and everyone's window widens the longer they wait,
+    so nobody waits forever for a perfect match. Rather than checking everyone as their windows widen, each pair of neighbours has the time
+    they'll accept each other kept in a heap, so arriving, leaving and pairing are all a binary search or a heap operation however many are waiting
+    """
+    def __init__(self, on_pair : Callable[[Ticket, Ticket], None], initial_window : float = INITIAL_WINDOW, window_growth : float = WINDOW_GROWTH):
+        self.on_pair = on_pair
+        self.initial_window = initial_window
+        self.window_growth = window_growth
+        #bucket -> (rating, number, ticket) for everyone waiting in it, in rating order
+        self.buckets : dict[Hashable, list[tuple[float, int, Ticket]]] = {}
+        #(when, sequence, lower, higher) for neighbours in a bucket, from when they'll accept each other. Ones that stop being neighbours are skipped
+        self.deadlines : list[tuple[float, int, Ticket, Ticket]] = []
+        self.waiting = 0
+        self.__numbers = itertools.count()
+
+    def __len__(self) -> int:
+        return self.waiting
+
+    def window(self, ticket : Ticket, now : float) -> float:
+        return self.initial_window + self.window_growth * (now - ticket.joined_at)
+
+    def accepts(self, first : Ticket, second : Ticket, now : float) -> bool:
+        #whichever of them has waited longer has the wider window, and is the one who decides
+        return abs(first.rating - second.rating) <= max(self.window(first, now), self.window(second, now))
+
+    def join(self, player, rating : float = DEFAULT_RATING, bucket : Hashable = None) -> Ticket:
+        """
+        Pairs the player with the closest rating in their bucket if either of them will accept it, otherwise queues them
+        """
+        now = time.monotonic()
+        ticket = Ticket(player, rating, bucket, next(self.__numbers), now)
+        waiting = self.buckets.setdefault(bucket, [])
+        index = bisect.bisect_left(waiting, (rating, ticket.number))
+
+        neighbours = [i for i in (index - 1, index) if 0 <= i < len(waiting) and self.accepts(waiting[i][2], ticket, now)]
+        if neighbours:
+            opponent = self.__remove(waiting, min(neighbours, key=lambda i: abs(waiting[i][0] - rating)))
+            self.on_pair(opponent, ticket)
+            return ticket
+
+        waiting.insert(index, (rating, ticket.number, ticket))
+        ticket.queued = True
+        self.waiting += 1
+        if index > 0: self.__schedule(waiting[index - 1][2], ticket)
+        if index + 1 < len(waiting): self.__schedule(ticket, waiting[index + 1][2])
+        return ticket
+
+    def leave(self, ticket : Ticket) -> bool:
+        """
+        Takes a player out of the queue, returning False if they weren't in it
+        """
+        if not ticket.queued: return False
+        waiting = self.buckets[ticket.bucket]
+        self.__remove(waiting, bisect.bisect_left(waiting, (ticket.rating, ticket.number)))
+        return True
+
+    def sweep(self):
+        """
+        Pairs every pair of neighbours whose windows have widened enough to accept each other by now
+        """
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            lower, higher = heapq.heappop(self.deadlines)[2:]
+            if not (lower.queued and higher.queued): continue
+            waiting = self.buckets[lower.bucket]
+            index = bisect.bisect_left(waiting, (lower.rating, lower.number))
+            if index + 1 == len(waiting) or waiting[index + 1][2] is not higher: continue
+            #taking out the higher one first leaves the lower one where it was found
+            self.__remove(waiting, index + 1, reschedule=False)
+            self.__remove(waiting, index)
+            if lower.joined_at > higher.joined_at: lower, higher = higher, lower
+            self.on_pair(lower, higher)
+
+    async def keep_sweeping(self, interval : float = 0.25):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def __remove(self, waiting : list[tuple[float, int, Ticket]], index : int, reschedule : bool = True) -> Ticket:
+        ticket = waiting.pop(index)[2]
+        ticket.queued = False
+        self.waiting -= 1
+        if not waiting: del self.buckets[ticket.bucket]
+        #the players either side of the one that left are neighbours now
+        elif reschedule and 0 < index < len(waiting): self.__schedule(waiting[index - 1][2], waiting[index][2])
+        return ticket
+
+    def __schedule(self, lower : Ticket, higher : Ticket):
+        #the wider window is the one that started first, it reaches the gap between them at this time
+        gap = higher.rating - lower.rating - self.initial_window
+        if gap <= 0: when = 0
+        elif self.window_growth > 0: when = min(lower.joined_at, higher.joined_at) + gap / self.window_growth
+        else: return
+        if math.isfinite(when): heapq.heappush(self.deadlines, (when, next(self.__numbers), lower, higher))
@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import time
+from typing import Callable
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DURATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_names : tuple[str, ...], label_values : tuple[str, ...], extra : dict[str, str] = {}) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(label_names, label_values)) + list(extra.items())]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """
+    The shared parts of every metric: a name, help text, and one child per combination of label values
+    """
+    kind = "untyped"
+
+    def __init__(self, name : str, help_text : str, label_names : tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._children : dict[tuple[str, ...], "_Value | _HistogramValue"] = {}
+        registry.register(self)
+
+    def labels(self, *label_values : str):
+        try: return self._children[label_values]
+        except KeyError:
+            if len(label_values) != len(self.label_names): raise ValueError(f"{self.name} needs the labels {self.label_names}")
+            child = self._children[label_values] = self._new_child()
+            return child
+
+    def _new_child(self): raise NotImplementedError
+
+    def _samples(self) -> list[str]:
+        children = self._children if self.label_names else {(): self.labels()}
+        lines = []
+        for label_values, child in children.items():
+            lines += child._child_samples(self.name, self.label_names, label_values)
+        return lines
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples())
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount : float = 1): self.value += amount
+    def dec(self, amount : float = 1): self.value -= amount
+    def set(self, value : float): self.value = value
+
+    def _child_samples(self, name : str, label_names : tuple[str, ...], label_values : tuple[str, ...]) -> list[str]:
+        return [f"{name}{_format_labels(label_names, label_values)} {self.value}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self): return _Value()
+    def inc(self, amount : float = 1): self.labels().inc(amount)
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. Passing function makes it read that function at scrape time instead
+    """
+    kind = "gauge"
+
+    def __init__(self, name : str, help_text : str, label_names : tuple[str, ...] = (), function : Callable[[], float] | None = None):
+        self.function = function
+        super().__init__(name, help_text, label_names)
+
+    def _new_child(self): return _Value()
+    def inc(self, amount : float = 1): self.labels().inc(amount)
+    def dec(self, amount : float = 1): self.labels().dec(amount)
+    def set(self, value : float): self.labels().set(value)
+
+    def _samples(self) -> list[str]:
+        if self.function != None: return [f"{self.name} {float(self.function())}"]
+        return super()._samples()
+
+class _HistogramValue:
+    def __init__(self, buckets : tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value : float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def _child_samples(self, name : str, label_names : tuple[str, ...], label_values : tuple[str, ...]) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(f"{name}_bucket{_format_labels(label_names, label_values, {'le': le})} {total}")
+        lines.append(f"{name}_sum{_format_labels(label_names, label_values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(label_names, label_values)} {total}")
+        return lines
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name : str, help_text : str, label_names : tuple[str, ...] = (), buckets : tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, label_names)
+
+    def _new_child(self): return _HistogramValue(self.buckets)
+    def observe(self, value : float): self.labels().observe(value)
+
+class Registry:
+    def __init__(self):
+        self.metrics : list[Metric] = []
+
+    def register(self, metric : Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = Registry()
+
+async def _handle_scrape(reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        #skip the headers, nothing in them changes the answer
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""): pass
+        path = request_line.split(b" ")[1] if len(request_line.split(b" ")) > 1 else b"/"
+        if path.split(b"?")[0] in (b"/", b"/metrics"):
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError): pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host : str, port : int) -> asyncio.Server:
+    """
+    Serves every registered metric in the Prometheus text format at /metrics
+    """
+    return await asyncio.start_server(_handle_scrape, host, port)
+
+async def watch_event_loop_lag(histogram : Histogram, interval : float = 0.5):
+    """
+    Measures how late the event loop wakes up from a sleep, which climbs as the loop gets saturated
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,77 @@
+import json
+import struct
+
+#the fastest JSON library that's installed, they all read and write the same JSON so the other end never knows which one it was
+try: import orjson
+except ImportError: orjson = None
+try: import ujson
+except ImportError: ujson = None
+
+if orjson != None:
+    JSON_BACKEND = "orjson"
+    #orjson writes bytes, which would go out as a binary frame, so it goes back to text for the websocket
+    _dumps = lambda message: orjson.dumps(message).decode()
+    _loads = orjson.loads
+elif ujson != None:
+    JSON_BACKEND = "ujson"
+    _dumps = ujson.dumps
+    _loads = ujson.loads
+else:
+    JSON_BACKEND = "json"
+    _dumps = json.dumps
+    _loads = json.loads
+
+JSON = "json"
+BINARY = "binary"
+#in order of preference
+SUPPORTED_PROTOCOLS = [BINARY, JSON]
+#optional messages a client can say it understands in its username message
+SUPPORTED_FEATURES = ["ship_sunk", "resume", "heartbeat"]
+
+#binary frames start with a one byte message code, followed by the fields of that message
+_BINARY_FORMATS : dict[str, tuple[int, struct.Struct]] = {
+    "guess": (1, struct.Struct("!BHH")),
+    "guess_result": (2, struct.Struct("!BHHB")),
+    "enemy_guess_result": (3, struct.Struct("!BHHB")),
+}
+#sink messages are a code and a cell count, followed by that many (row, col) pairs
+_BINARY_CELL_LISTS : dict[str, int] = {"ship_sunk": 4, "enemy_ship_sunk": 5}
+_CELL_LIST_HEADER = struct.Struct("!BB")
+#the count is one byte, so no ship can be longer than this
+MAX_CELL_LIST = 255
+_CELL = struct.Struct("!HH")
+_BINARY_TYPES : dict[int, tuple[str, struct.Struct]] = {code: (message_type, packer) for message_type, (code, packer) in _BINARY_FORMATS.items()}
+_BINARY_CELL_LIST_TYPES : dict[int, str] = {code: message_type for message_type, code in _BINARY_CELL_LISTS.items()}
+
+def choose_protocol(offered : list[str] | None) -> str:
+    """
+    Picks the best protocol both sides can speak, falling back to JSON for anything that doesn't offer a list
+    """
+    for protocol in SUPPORTED_PROTOCOLS:
+        if offered and protocol in offered: return protocol
+    return JSON
+
+def encode(message : dict, protocol : str = JSON) -> str | bytes:
+    if protocol == BINARY and message["type"] in _BINARY_FORMATS:
+        code, packer = _BINARY_FORMATS[message["type"]]
+        if "result" in message: return packer.pack(code, *message["position"], message["result"])
+        return packer.pack(code, *message["position"])
+    if protocol == BINARY and message["type"] in _BINARY_CELL_LISTS:
+        cells = message["cells"]
+        return _CELL_LIST_HEADER.pack(_BINARY_CELL_LISTS[message["type"]], len(cells)) + b"".join(_CELL.pack(*cell) for cell in cells)
+    return _dumps(message)
+
+def decode(frame : str | bytes) -> dict:
+    if type(frame) == str: return _loads(frame)
+
+    if frame[:1] and frame[0] in _BINARY_CELL_LIST_TYPES:
+        count = _CELL_LIST_HEADER.unpack_from(frame)[1]
+        cells = [list(_CELL.unpack_from(frame, _CELL_LIST_HEADER.size + i * _CELL.size)) for i in range(count)]
+        return {"type": _BINARY_CELL_LIST_TYPES[frame[0]], "cells": cells}
+
+    try: message_type, packer = _BINARY_TYPES[frame[0]]
+    except (KeyError, IndexError): raise ValueError(f"Unknown binary message: {frame!r}")
+    fields = packer.unpack(frame)
+    message = {"type": message_type, "position": [fields[1], fields[2]]}
+    if len(fields) > 3: message["result"] = fields[3]
+    return message
@@ -1,164 +1,901 @@
 import asyncio
-import json
 import websockets
 import websockets.asyncio
 import websockets.asyncio.server
 import sys
 import os
+import collections
+import logging
+import time
+import math
+import zlib
+import secrets
+import socket as sockets
+import multiprocessing
+import multiprocessing.connection
+import Bitboard
+import Protocol
+import ShipWarLog
+import Metrics
+import MatchLog
+import Bot
+import Strategy
+import Matchmaking
 
-def guess_result(reply : dict, index : int) -> int:
+#uvloop gets messages on and off the sockets a lot faster than asyncio's own loop, but the server runs fine without it
+try: import uvloop
+except ImportError: uvloop = None
+
+DEFAULT_PORT = 6363
+DEFAULT_METRICS_PORT = 9363
+MAX_PLAYERS = 2
+#spectators with more than this many bytes waiting to be sent are too slow to keep up, and get dropped
+SPECTATOR_BUFFER_LIMIT = 256 * 1024
+#the board size and fleet a match is played with
+Settings = tuple[int, tuple[int, ...]]
+MIN_GRID_SIZE = 5
+#cells have to fit in the binary protocol's 16 bit coordinates, and this is already plenty
+MAX_GRID_SIZE = 1000
+MAX_SHIPS = 20
+#a sunk ship goes out to binary clients in a single frame, which only has room for so many cells
+MAX_SHIP_LENGTH = Protocol.MAX_CELL_LIST
+#names past this are cut short, they have to fit in a match log record and on the other player's screen
+MAX_NAME_LENGTH = 32
+
+def parse_settings(grid_size : str | int, fleet : str | tuple[int, ...]) -> Settings:
+    """
+    Turns a grid size and a comma separated list of ship lengths into match settings, raising ValueError if they can't be played
+    """
+    try: grid_size = int(grid_size)
+    except ValueError: raise ValueError("the grid size has to be a whole number") from None
+    if type(fleet) == str:
+        try: fleet = tuple(int(length) for length in fleet.split(","))
+        except ValueError: raise ValueError("the fleet has to be ship lengths separated by commas") from None
+    if not MIN_GRID_SIZE <= grid_size <= MAX_GRID_SIZE: raise ValueError(f"the grid has to be {MIN_GRID_SIZE} to {MAX_GRID_SIZE} cells across")
+    if not 1 <= len(fleet) <= MAX_SHIPS: raise ValueError(f"a fleet has to have 1 to {MAX_SHIPS} ships")
+    longest = min(grid_size, MAX_SHIP_LENGTH)
+    if not all(1 <= length <= longest for length in fleet): raise ValueError(f"ships have to be 1 to {longest} cells long on this grid")
+    #leave plenty of room, so that there's always somewhere left to put the last ship
+    if sum(fleet) * 2 > grid_size * grid_size: raise ValueError("that fleet doesn't fit on the board")
+    return grid_size, fleet
+
+#the settings for players who don't ask for any
+DEFAULT_SETTINGS = parse_settings(os.environ.get("SHIPWAR_GRID_SIZE", Bitboard.GRID_SIZE), os.environ.get("SHIPWAR_FLEET", ",".join(map(str, Bitboard.FLEET))))
+#how long a player handed to another worker for their match waits there for their opponent to arrive too
+HANDOVER_SECONDS = 10
+#how long a player's seat is held after their connection breaks, waiting for them to resume
+RESUME_GRACE_SECONDS = float(os.environ.get("SHIPWAR_RESUME_GRACE", 30))
+#how long a player without a code waits for someone before getting a bot to play instead, 0 means they always wait
+BOT_WAIT_SECONDS = float(os.environ.get("SHIPWAR_BOT_WAIT", 0))
+BOT_THINK_SECONDS = 0.5
+#how far apart two players' ratings can be when they start waiting for a match, and how much further for every second they wait
+MATCH_WINDOW = float(os.environ.get("SHIPWAR_MATCH_WINDOW", Matchmaking.INITIAL_WINDOW))
+MATCH_WINDOW_GROWTH = float(os.environ.get("SHIPWAR_MATCH_WINDOW_GROWTH", Matchmaking.WINDOW_GROWTH))
+#messages that can wait to go out to one player, past which they count as too slow, and how long they can stay that slow
+SEND_QUEUE_HIGH_WATER = int(os.environ.get("SHIPWAR_SEND_QUEUE", 64))
+SEND_QUEUE_LIMIT = SEND_QUEUE_HIGH_WATER * 4
+SLOW_CLIENT_SECONDS = float(os.environ.get("SHIPWAR_SLOW_CLIENT_SECONDS", 5))
+#how often connections are pinged, and how long one can go without a word (or a pong) before it counts as dead. 0 turns either off
+PING_INTERVAL_SECONDS = float(os.environ.get("SHIPWAR_PING_INTERVAL", 20))
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("SHIPWAR_IDLE_TIMEOUT", 60))
+#bytes the OS can be holding for one connection before a send waits for it to drain
+SEND_BUFFER_HIGH_WATER = int(os.environ.get("SHIPWAR_SEND_BUFFER", 64 * 1024))
+
+log = ShipWarLog.get_logger("server")
+
+#message types from clients get their own metric labels, anything else is counted as "other"
+MESSAGE_TYPES = {"username", "ships", "guess", "disconnection", "error", "pong"}
+CONNECTIONS = Metrics.Gauge("shipwar_connections", "Open client connections")
+ACTIVE_MATCHES = Metrics.Gauge("shipwar_active_matches", "Matches that haven't closed yet")
+MATCHES_CLOSED = Metrics.Counter("shipwar_matches_closed_total", "Matches that have closed, by whether someone won or it was abandoned", ("outcome",))
+MATCH_SECONDS = Metrics.Histogram("shipwar_match_duration_seconds", "How long matches lasted, from the first player joining to the match closing", buckets=Metrics.DURATION_BUCKETS)
+MESSAGES = Metrics.Counter("shipwar_messages_received_total", "Messages received from clients, by type", ("type",))
+HANDLER_SECONDS = Metrics.Histogram("shipwar_handler_seconds", "Time spent handling a message from a client, including the replies it sends, by type", ("type",))
+SEND_SECONDS = Metrics.Histogram("shipwar_send_seconds", "Time spent sending a message to a client, by type", ("type",))
+LOOP_LAG_SECONDS = Metrics.Histogram("shipwar_event_loop_lag_seconds", "How late the event loop wakes up from a sleep")
+SPECTATORS = Metrics.Gauge("shipwar_spectators", "Connected spectators")
+SPECTATORS_DROPPED = Metrics.Counter("shipwar_spectators_dropped_total", "Spectators dropped for falling too far behind")
+ROUTED_CONNECTIONS = Metrics.Counter("shipwar_routed_connections_total", "Connections passed on to the worker that owns their match")
+MATCHMAKING_RELAYS = Metrics.Counter("shipwar_matchmaking_relays_total", "Players without a code passed on to the matchmaking worker to wait for an opponent")
+HANDOVERS_EXPIRED = Metrics.Counter("shipwar_handovers_expired_total", "Matches handed to this worker by the matchmaking worker that only one of the players reached")
+SLOW_CLIENTS_DROPPED = Metrics.Counter("shipwar_slow_clients_dropped_total", "Players dropped for letting their outgoing messages pile up")
+REJECTED_FLEETS = Metrics.Counter("shipwar_rejected_fleets_total", "Fleets that broke the placement rules")
+BOT_MATCHES = Metrics.Counter("shipwar_bot_matches_total", "Matches where a player waited too long and got a bot instead")
+SESSIONS = Metrics.Counter("shipwar_dropped_sessions_total", "Dropped connections whose seat was held, by whether the player came back", ("outcome",))
+IDLE_CONNECTIONS_REAPED = Metrics.Counter("shipwar_idle_connections_reaped_total", "Player connections cut off for going quiet for too long")
+QUEUED_PLAYERS = Metrics.Gauge("shipwar_matchmaking_queue_players", "Players waiting in the matchmaking queue for an opponent", function=lambda: len(matchmaking_queue))
+QUEUE_SECONDS = Metrics.Histogram("shipwar_matchmaking_wait_seconds", "How long players waited in the matchmaking queue before being paired")
+TASKS = Metrics.Gauge("shipwar_tasks", "Asyncio tasks alive, which should stay level on a server that isn't leaking", function=lambda: len(asyncio.all_tasks()))
+LOG_QUEUE_DEPTH = Metrics.Gauge("shipwar_log_queue_depth", "Log records waiting to be written", function=ShipWarLog.log_queue.qsize)
+
+class Outbox:
+    """
+    Messages waiting to go out to one connection, written by a task of its own so that a slow connection only ever holds itself up
+    """
+    def __init__(self, socket : websockets.asyncio.server.ServerConnection | Bot.LocalConnection):
+        self.socket = socket
+        self.queue : collections.deque[tuple[str | bytes, str] | None] = collections.deque()
+        self.waiting = asyncio.Event()
+        #when the queue last went over the high-water mark, if it hasn't come back down since
+        self.over_since : float | None = None
+        self.closed = False
+        self.writer = asyncio.create_task(self.__write())
+
+    def put(self, frame : str | bytes, message_type : str):
+        if self.closed: return
+        self.queue.append((frame, message_type))
+        self.waiting.set()
+        if len(self.queue) <= SEND_QUEUE_HIGH_WATER: return
+        now = time.monotonic()
+        if self.over_since == None: self.over_since = now
+        if len(self.queue) > SEND_QUEUE_LIMIT or now - self.over_since > SLOW_CLIENT_SECONDS: self.evict()
+
+    def evict(self):
+        log.warning("dropping a slow client", extra={"queued": len(self.queue), "over_for": round(time.monotonic() - self.over_since, 3)})
+        SLOW_CLIENTS_DROPPED.inc()
+        self.abandon()
+        #a client this far behind won't read a close frame either, so the connection is cut straight away.
+        #the listener sees that as the connection breaking, so a player that can resume keeps their seat
+        if self.socket.transport != None: self.socket.transport.abort()
+        else: run_in_background(self.socket.close(1008, "Too slow"))
+
+    def abandon(self):
+        if self.closed: return
+        self.closed = True
+        self.queue.clear()
+        self.writer.cancel()
+
+    async def close(self, timeout : float = 5):
+        """
+        Stops taking messages and waits a while for the ones already queued to go out
+        """
+        if self.closed: return
+        self.closed = True
+        self.queue.append(None)
+        self.waiting.set()
+        try: await asyncio.wait_for(self.writer, timeout)
+        except asyncio.TimeoutError: pass
+
+    async def __write(self):
+        while True:
+            if not self.queue:
+                self.waiting.clear()
+                await self.waiting.wait()
+            entry = self.queue.popleft()
+            if entry == None: return
+            if len(self.queue) <= SEND_QUEUE_HIGH_WATER // 2: self.over_since = None
+            frame, message_type = entry
+            started = time.perf_counter()
+            #a broken connection is noticed by the player's own listener, which decides what happens to their seat
+            try: await self.socket.send(frame)
+            except websockets.exceptions.ConnectionClosed: return
+            SEND_SECONDS.labels(message_type).observe(time.perf_counter() - started)
+
+class Match:
+    """
+    A single game between two players, holding the state that used to be kept in globals
+    """
+    def __init__(self, match_id : int, code : str | None = None, settings : Settings = DEFAULT_SETTINGS):
+        self.match_id = match_id
+        self.code = code
+        self.grid_size, self.fleet = settings
+        self.connected_clients : list[websockets.asyncio.server.ServerConnection | None] = [None] * MAX_PLAYERS
+        self.outboxes : list[Outbox | None] = [None] * MAX_PLAYERS
+        self.players : list[str | None] = [None] * MAX_PLAYERS
+        self.players_ships : list[Bitboard.AnyBoard | None] = [None] * MAX_PLAYERS
+        #every client speaks JSON until it asks for something else in its username message
+        self.protocols : list[str] = [Protocol.JSON] * MAX_PLAYERS
+        self.features : list[set[str]] = [set() for i in range(MAX_PLAYERS)]
+        self.spectators : set[websockets.asyncio.server.ServerConnection] = set()
+        #a seat is taken once it has a resume token, even while its connection is down
+        self.resume_tokens : list[str | None] = [None] * MAX_PLAYERS
+        self.grace_timers : list[asyncio.Task | None] = [None] * MAX_PLAYERS
+        #the task listening to each player, and when each player's connection was last heard from
+        self.listeners : list[asyncio.Task | None] = [None] * MAX_PLAYERS
+        self.last_seen : list[float] = [time.monotonic()] * MAX_PLAYERS
+        #whose guess the match is waiting for
+        self.turn = 0
+        self.closed = False
+        #set once both fleets have arrived, and once a fleet is destroyed or the match ends early
+        self.ships_placed = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.started_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return not self.closed and None in self.resume_tokens
+
+    def send_buffer_size(self) -> int:
+        return sum(socket.transport.get_write_buffer_size() for socket in self.connected_clients if socket != None and socket.transport != None)
+
+    def queued_messages(self) -> int:
+        return sum(len(outbox.queue) for outbox in self.outboxes if outbox != None)
+
+    def add_client(self, socket : websockets.asyncio.server.ServerConnection) -> int:
+        player_id = self.resume_tokens.index(None)
+        self.attach(player_id, socket)
+        self.resume_tokens[player_id] = secrets.token_urlsafe(16)
+        return player_id
+
+    def attach(self, player_id : int, socket : websockets.asyncio.server.ServerConnection | None):
+        """
+        Points the seat at a new connection, or at nothing, throwing away anything still queued for the old one
+        """
+        if self.outboxes[player_id] != None: self.outboxes[player_id].abandon()
+        self.connected_clients[player_id] = socket
+        self.outboxes[player_id] = Outbox(socket) if socket != None else None
+        self.last_seen[player_id] = time.monotonic()
+
+class MatchRegistry:
+    """
+    Keeps track of every running match, and which of them still have a free slot
+    """
+    def __init__(self):
+        self.matches : dict[int, Match] = {}
+        #matches players asked for by code, until both have joined
+        self.open_coded_matches : dict[str, Match] = {}
+        #every running match by its code, so spectators can find them
+        self.by_code : dict[str, Match] = {}
+        #resume token -> the match and seat it belongs to
+        self.sessions : dict[str, tuple[Match, int]] = {}
+        self.__next_id = 0
+
+    def new_code(self, owner : int | None = None) -> str:
+        """
+        Makes up a code for a match nobody asked for by code, that routes to the given worker, or this one
+        """
+        if cluster != None and owner == None: owner = cluster.index
+        while True:
+            code = secrets.token_urlsafe(4)
+            if code not in self.by_code and (cluster == None or cluster.owner_of(code) == owner): return code
+
+    def new_match(self, code : str | None = None, settings : Settings = DEFAULT_SETTINGS) -> Match:
+        match = Match(self.__next_id, code if code != None else self.new_code(), settings)
+        self.__next_id += 1
+        self.matches[match.match_id] = match
+        self.by_code[match.code] = match
+        record(match, MatchLog.MATCH_START, payload=match.code.encode())
+        ACTIVE_MATCHES.inc()
+        return match
+
+    def seat(self, match : Match, socket : websockets.asyncio.server.ServerConnection | Bot.LocalConnection) -> int:
+        player_id = match.add_client(socket)
+        self.sessions[match.resume_tokens[player_id]] = (match, player_id)
+        if not match.is_open() and self.open_coded_matches.get(match.code) is match: del self.open_coded_matches[match.code]
+        return player_id
+
+    def join(self, socket : websockets.asyncio.server.ServerConnection, code : str, settings : Settings = DEFAULT_SETTINGS) -> tuple[Match, int]:
+        """
+        Seats the player in the match for their code, whoever uses a code first picks the settings for everyone else who uses it
+        """
+        match = self.open_coded_matches.get(code)
+        if match == None or not match.is_open(): match = self.open_coded_matches[code] = self.new_match(code, settings)
+        return match, self.seat(match, socket)
+
+    def close(self, match : Match):
+        if match.closed: return
+        match.closed = True
+        self.matches.pop(match.match_id, None)
+        if self.open_coded_matches.get(match.code) is match: del self.open_coded_matches[match.code]
+        if self.by_code.get(match.code) is match: del self.by_code[match.code]
+        for token in match.resume_tokens: self.sessions.pop(token, None)
+        for timer in match.grace_timers:
+            if timer != None: timer.cancel()
+        ACTIVE_MATCHES.dec()
+        MATCHES_CLOSED.labels("won" if any(board and board.destroyed() for board in match.players_ships) else "abandoned").inc()
+        MATCH_SECONDS.observe(time.monotonic() - match.started_at)
+        #wake anything still waiting on the match, so it can see that it has closed
+        match.ships_placed.set()
+        match.finished.set()
+
+match_registry = MatchRegistry()
+match_log : MatchLog.MatchLogWriter | None = None
+def start_queued_match(first : Matchmaking.Ticket, second : Matchmaking.Ticket):
+    """
+    Puts two players the matchmaking queue has paired into a new match, and wakes them both up.
+    With more than one worker the match goes on the one the player who waited longer first connected to,
+    which spreads matches over the workers as evenly as connections are. If that's another worker both players are given its code to meet there with
+    """
+    owner = first.player[2]
+    if owner != None and owner != cluster.index:
+        code = match_registry.new_code(owner)
+        for ticket in (first, second):
+            QUEUE_SECONDS.observe(time.monotonic() - ticket.joined_at)
+            ticket.player[1].set_result((None, 0, code))
+        return
+
+    match = match_registry.new_match(settings=first.bucket[0])
+    for ticket in (first, second):
+        socket, paired = ticket.player[:2]
+        QUEUE_SECONDS.observe(time.monotonic() - ticket.joined_at)
+        paired.set_result((match, match_registry.seat(match, socket), match.code))
+
+matchmaking_queue = Matchmaking.MatchmakingQueue(start_queued_match, MATCH_WINDOW, MATCH_WINDOW_GROWTH)
+#tasks nothing waits on, kept here so they can't be garbage collected before they finish
+background_tasks : set[asyncio.Task] = set()
+
+def run_in_background(coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def record(match : Match, event : int, player : int = MatchLog.NO_PLAYER, payload : bytes = b""):
+    if match_log != None: match_log.write(event, match.match_id, player, payload)
+
+async def flush_match_log(interval : float = 1):
+    while True:
+        await asyncio.sleep(interval)
+        match_log.flush()
+
+#the worker every player without a code is sent to, so they all wait in the same matchmaking queue
+MATCHMAKING_WORKER = 0
+
+class Cluster:
+    """
+    Where this process sits among the workers when the server runs one per core.
+    Every worker shares the public port, and also listens on its own local port so the others can hand it connections
+    """
+    def __init__(self, index : int, workers : int, internal_base_port : int):
+        self.index = index
+        self.workers = workers
+        self.internal_base_port = internal_base_port
+
+    def internal_port(self, index : int) -> int:
+        return self.internal_base_port + index
+
+    def owner_of(self, code : str | None) -> int:
+        if code == None: return MATCHMAKING_WORKER
+        return zlib.crc32(code.encode()) % self.workers
+
+cluster : Cluster | None = None
+SEND_QUEUE_DEPTH = Metrics.Gauge("shipwar_send_queue_messages", "Messages queued for players that haven't been written to their sockets yet", function=lambda: sum(match.queued_messages() for match in match_registry.matches.values()))
+SEND_BUFFER_BYTES = Metrics.Gauge("shipwar_send_buffer_bytes", "Bytes written to client sockets that the OS hasn't taken yet", function=lambda: sum(match.send_buffer_size() for match in match_registry.matches.values()))
+
+def guess_result(match : Match, reply : dict, index : int) -> int:
     if reply["type"] != "guess": return 0
+    return match.players_ships[1 - index].shoot(reply["position"])
 
-    global players_ships
-    opponents_ships = players_ships[1 - index]
-    for ship_locations in opponents_ships:
-        for location in ship_locations:
-            if location[:2] == reply["position"]: 
-                location[-1] = 1
-                return 2 # the result was a hit
-    return 1
-
-def check_for_sinking(index : int) -> list[list[int, int]] | None:
-    global players_ships
-    opponents_ships = players_ships[1 - index]
-    for ship in opponents_ships:
-        if sum([location[2] for location in ship]) == len(ship):
-            players_ships[1 - index].remove(ship)
-            return ship
+def check_for_sinking(match : Match, index : int) -> list[tuple[int, int]] | None:
+    return match.players_ships[1 - index].pop_sunk_ship()
     
-async def send_guess_result(socket : websockets.asyncio.server.ServerConnection, other_socket : websockets.asyncio.server.ServerConnection, position : list[int, int], result : int):
-    await socket.send(json.dumps({"type": "guess_result", "position": [int(i) for i in position], "result": result}))
-    if other_socket != None:
-        await other_socket.send(json.dumps({"type": "enemy_guess_result", "position": [int(i) for i in position], "result": result}))
+def send(match : Match, player_id : int, message : dict):
+    """
+    Queues the message for the player without waiting for it to be written
+    """
+    outbox = match.outboxes[player_id]
+    if outbox == None: return
+    outbox.put(Protocol.encode(message, match.protocols[player_id]), message["type"])
+
+def broadcast_to_spectators(match : Match, message : dict):
+    """
+    Encodes the message once and writes it to every spectator without waiting on any of them
+    """
+    if not match.spectators: return
+    for spectator in list(match.spectators):
+        if spectator.transport != None and spectator.transport.get_write_buffer_size() > SPECTATOR_BUFFER_LIMIT:
+            match.spectators.discard(spectator)
+            SPECTATORS_DROPPED.inc()
+            run_in_background(spectator.close(1008, "Too far behind"))
+    websockets.asyncio.server.broadcast(match.spectators, Protocol.encode(message))
+
+def board_snapshot(board : Bitboard.AnyBoard | None) -> dict | None:
+    """
+    The cells shot at on a board, without giving away any ship that hasn't sunk
+    """
+    if board == None: return None
+    return {"hits": board.hit_cells(), "misses": board.miss_cells(), "sunk": board.sunk_ships()}
+
+def snapshot(match : Match) -> dict:
+    """
+    Everything a spectator needs to draw the match so far
+    """
+    boards = [board_snapshot(board) for board in match.players_ships]
+    return {"type": "spectate", "match": match.code, "players": match.players, "grid_size": match.grid_size, "boards": boards}
+
+def resume_snapshot(match : Match, player_id : int) -> dict:
+    """
+    Everything a player needs to pick their match back up: their own fleet, the shots at it, and their shots at the opponent
+    """
+    fleet = match.players_ships[player_id]
+    return {"type": "resumed", "player": player_id + 1, "match": match.code, "opponent": match.players[1 - player_id], "turn": match.turn == player_id,
+            "grid_size": match.grid_size, "ships": None if fleet == None else fleet.fleet_cells(),
+            "board": board_snapshot(fleet), "radar": board_snapshot(match.players_ships[1 - player_id])}
 
-def ship_handling(index : int, reply : dict):
+def send_guess_result(match : Match, player_id : int, position : list[int, int], result : int):
+    position = [int(i) for i in position]
+    send(match, player_id, {"type": "guess_result", "position": position, "result": result})
+    send(match, 1 - player_id, {"type": "enemy_guess_result", "position": position, "result": result})
+    broadcast_to_spectators(match, {"type": "guess_result", "player": player_id, "position": position, "result": result})
+
+def send_sink(match : Match, player_id : int, cells : list[tuple[int, int]]):
+    cells = [[int(i) for i in cell] for cell in cells]
+    #clients that can't take a whole ship in one frame get a sunk guess result per cell instead
+    for receiver, message_type, legacy_type in ((player_id, "ship_sunk", "guess_result"), (1 - player_id, "enemy_ship_sunk", "enemy_guess_result")):
+        if "ship_sunk" in match.features[receiver]:
+            send(match, receiver, {"type": message_type, "cells": cells})
+        else:
+            for cell in cells: send(match, receiver, {"type": legacy_type, "position": cell, "result": 3})
+    broadcast_to_spectators(match, {"type": "ship_sunk", "player": player_id, "cells": cells})
+
+def ship_handling(match : Match, index : int, reply : dict):
     if reply["type"] != "ships": return False
+    if match.players_ships[index] != None: raise ValueError("the fleet has already been placed")
 
-    global players_ships
-    reply_with_hit_record = []
-    for ship in reply["message"]:
-        for location in ship:
-            location.append(0)
-        reply_with_hit_record.append(ship)
-    players_ships[index] = reply_with_hit_record
-
-async def disconnect(player_id : int):
-    global game_over
-    if game_over: return
-
-    global players
-    global connected_clients
-    print(f"{players[player_id]} Disconnected")
-    try: other_socket = connected_clients[1 - player_id]
-    except: other_socket = None
-    if other_socket != None: await other_socket.send(json.dumps({"type":"disconnection"}))
-    
-    players[player_id] = None
-    connected_clients = []
+    match.players_ships[index] = Bitboard.new_board(Bitboard.validate_fleet(reply["message"], match.grid_size, match.fleet), match.grid_size)
+    record(match, MatchLog.PLACEMENT, index, MatchLog.encode_placement(match.players_ships[index]))
+    if None not in match.players_ships: match.ships_placed.set()
 
-    global players_ships
-    players_ships = [None, None]
+def disconnect(match : Match, player_id : int):
+    if match.closed: return
 
-    game_over = False
+    log.info("player disconnected", extra={"player": match.players[player_id], "match": match.match_id})
+    broadcast_to_spectators(match, {"type": "disconnection", "player": player_id})
+    record(match, MatchLog.DISCONNECT, player_id)
+    #closing the match ends both players' connections, so the opponent has to be told first
+    send(match, 1 - player_id, {"type":"disconnection"})
+    match_registry.close(match)
 
-async def client_listner(socket: websockets.asyncio.server.ServerConnection):
-    global connected_clients, players, players_ships
-    player_id = connected_clients.index(socket)
-    try:
-        other_socket = connected_clients[1 - player_id]
-    except: other_socket = None
+def drop(match : Match, player_id : int, socket : websockets.asyncio.server.ServerConnection):
+    """
+    Holds the seat of a player whose connection broke, so they can come back with their resume token
+    """
+    #a connection that has already been replaced by a resumed one doesn't speak for the seat any more
+    if match.closed or match.connected_clients[player_id] is not socket: return
+    if "resume" not in match.features[player_id] or RESUME_GRACE_SECONDS <= 0: return disconnect(match, player_id)
 
-    while socket in connected_clients:
-        try:
-            reply = json.loads(await socket.recv())
-            if other_socket == None:
-                try: other_socket = connected_clients[1 - player_id]
-                except: pass
-            print("Received:", reply)
-            if reply["type"] == "username":
-                players[player_id] = reply["name"]
-                print(f"{reply["name"]} joined")
-                if players[1 - player_id] != None:
-                    await socket.send(json.dumps({"type": "username", "name": players[1 - player_id]}))
-                    if other_socket != None:
-                        await other_socket.send(json.dumps({"type":"username", "name": players[player_id]}))
-            elif reply["type"] == "ships": 
-                ship_handling(player_id, reply)
-            elif reply["type"] == "guess":
-                result = guess_result(reply, player_id)
-                if result == 2: 
-                    sinking = check_for_sinking(player_id)
-                    if sinking != None:
-                        for i in sinking:
-                            await send_guess_result(socket, other_socket, i[:2], 3)
+    log.info("player dropped, holding their seat", extra={"player": match.players[player_id], "match": match.match_id, "grace": RESUME_GRACE_SECONDS})
+    match.attach(player_id, None)
+    match.grace_timers[player_id] = asyncio.create_task(expire_seat(match, player_id))
+
+async def expire_seat(match : Match, player_id : int):
+    await asyncio.sleep(RESUME_GRACE_SECONDS)
+    match.grace_timers[player_id] = None
+    SESSIONS.labels("expired").inc()
+    disconnect(match, player_id)
+
+def finish(match : Match, winner : int):
+    broadcast_to_spectators(match, {"type": "done", "winner": winner})
+    record(match, MatchLog.END, winner, bytes([winner]))
+    log.info("player won", extra={"player": match.players[winner], "match": match.match_id})
+    log.info("player lost", extra={"player": match.players[1 - winner], "match": match.match_id})
+    send(match, winner, {"type": "done", "result": 1})
+    send(match, 1 - winner, {"type": "done", "result": 0})
+    match_registry.close(match)
+
+async def client_listner(match : Match, player_id : int):
+    socket = match.connected_clients[player_id]
+
+    try:
+        while not match.closed:
+            started = None
+            message_type = "other"
+            try:
+                reply = Protocol.decode(await socket.recv())
+                started = time.perf_counter()
+                match.last_seen[player_id] = time.monotonic()
+                message_type = reply["type"] if reply["type"] in MESSAGE_TYPES else "other"
+                MESSAGES.labels(message_type).inc()
+                if log.isEnabledFor(logging.DEBUG): log.debug("received", extra={"sampled": True, "match": match.match_id, "player_id": player_id, "reply": reply})
+                if reply["type"] == "username":
+                    name = match.players[player_id] = str(reply["name"])[:MAX_NAME_LENGTH]
+                    match.protocols[player_id] = Protocol.choose_protocol([reply.get("protocol")])
+                    match.features[player_id] = set(reply.get("features", [])) & set(Protocol.SUPPORTED_FEATURES)
+                    log.info("player joined", extra={"player": name, "match": match.match_id, "code": match.code, "protocol": match.protocols[player_id]})
+                    broadcast_to_spectators(match, {"type": "username", "player": player_id, "name": name})
+                    record(match, MatchLog.USERNAME, player_id, name.encode())
+                    if match.players[1 - player_id] != None:
+                        send(match, player_id, {"type": "username", "name": match.players[1 - player_id]})
+                        send(match, 1 - player_id, {"type":"username", "name": match.players[player_id]})
+                elif reply["type"] == "ships": 
+                    try: ship_handling(match, player_id, reply)
+                    except ValueError as e:
+                        log.warning("rejected fleet", extra={"player": match.players[player_id], "match": match.match_id, "reason": str(e)})
+                        REJECTED_FLEETS.inc()
+                        send(match, player_id, {"type": "error", "message": f"Invalid fleet: {e}"})
+                        disconnect(match, player_id)
+                        return
+                elif reply["type"] == "guess":
+                    #a guess can't be resolved until the opponent has placed their ships
+                    if not match.ships_placed.is_set(): await match.ships_placed.wait()
+                    if match.closed: return
+                    position = [int(i) for i in reply["position"]]
+                    if Bitboard.cell_index(position, match.grid_size) == None:
+                        log.warning("guess off the board", extra={"player": match.players[player_id], "match": match.match_id, "position": position})
                         continue
-                await send_guess_result(socket, other_socket, reply["position"], result)
-            elif reply["type"] == "disconnection":
-                await disconnect(player_id)
+                    record(match, MatchLog.GUESS, player_id, MatchLog.CELL.pack(*position))
+                    result = guess_result(match, reply, player_id)
+                    sinking = check_for_sinking(match, player_id) if result == 2 else None
+                    record(match, MatchLog.RESULT, player_id, MatchLog.CELL.pack(*position) + bytes([result]) + b"".join(MatchLog.CELL.pack(*cell) for cell in sinking or []))
+                    match.turn = 1 - player_id
+                    if result == 2: 
+                        if sinking != None:
+                            send_sink(match, player_id, sinking)
+                            if match.players_ships[1 - player_id].destroyed(): finish(match, player_id)
+                            continue
+                    send_guess_result(match, player_id, reply["position"], result)
+                elif reply["type"] == "pong": pass # only here to show the connection is still alive
+                elif reply["type"] == "disconnection":
+                    disconnect(match, player_id)
+                    return
+                elif reply["type"] == "error":
+                    log.warning("client reported an error", extra={"player": match.players[player_id], "match": match.match_id, "error": reply["message"]})
+                    return
+                else:
+                    log.warning("unexpected message type", extra={"player": match.players[player_id], "match": match.match_id, "message_type": reply["type"]})
+                    return
+            except websockets.exceptions.ConnectionClosedError:
+                drop(match, player_id, socket)
                 return
-            elif reply["type"] == "error":
-                print(reply["message"])
+            except websockets.exceptions.ConnectionClosedOK:
+                if match.connected_clients[player_id] is socket: disconnect(match, player_id)
                 return
-            else:
-                print(f"Unexpected message type: {reply['type']}")
+            except Exception:
+                log.exception("error handling message", extra={"player": match.players[player_id], "match": match.match_id})
                 return
-        except websockets.exceptions.ConnectionClosedError:
-            await disconnect(player_id)
-            return
-        except websockets.exceptions.ConnectionClosedOK:
-            await disconnect(player_id)
-            return
-        except Exception as e:
-            print(f"Error received from {players[player_id]}: {e}")
-            raise e
+            finally:
+                if started != None: HANDLER_SECONDS.labels(message_type).observe(time.perf_counter() - started)
+    finally:
+        #however the listener stops, a match it leaves open with this connection in its seat would keep the opponent waiting forever.
+        #a dropped seat points at no connection, and a resumed one at the new connection, so neither is ended here
+        if not match.closed and match.connected_clients[player_id] is socket: disconnect(match, player_id)
+
+def match_code(path : str) -> str | None:
+    """
+    Players who connect to ws://host:port/<code> are put in a match with whoever else uses the same code
+    """
+    code = path.split("?")[0].strip("/")
+    return code if code else None
+
+def query(path : str) -> dict[str, str]:
+    return dict(parameter.partition("=")[::2] for parameter in path.partition("?")[2].split("&") if parameter)
+
+def is_spectator(path : str) -> bool:
+    """
+    Spectators connect to ws://host:port/<code>?spectate
+    """
+    return "spectate" in query(path)
+
+def resume_token(path : str) -> str | None:
+    """
+    Players coming back after their connection broke connect to ws://host:port/<code>?resume=<token>
+    """
+    return query(path).get("resume") or None
+
+def requested_rating(path : str) -> float:
+    """
+    Players say how good they are with ?rating=<number>, and get matched with players close to it. There are no accounts to keep one for them
+    """
+    try: rating = float(query(path).get("rating", Matchmaking.DEFAULT_RATING))
+    except ValueError: raise ValueError("the rating has to be a number") from None
+    if not math.isfinite(rating): raise ValueError("the rating has to be a number")
+    return rating
+
+def settings_query(settings : Settings) -> str:
+    return f"grid={settings[0]}&fleet={','.join(map(str, settings[1]))}"
+
+def connected_worker(path : str, relayed : bool) -> int | None:
+    """
+    The worker a player first connected to. Workers passing a player without a code on to the matchmaking worker add ?via=<worker>
+    """
+    if cluster == None: return None
+    if not relayed: return cluster.index
+    try: worker = int(query(path).get("via", cluster.index))
+    except ValueError: return cluster.index
+    return worker if 0 <= worker < cluster.workers else cluster.index
+
+def requested_settings(path : str) -> Settings:
+    """
+    Players can ask for a board size and fleet with ws://host:port/<code>?grid=<size>&fleet=<length>,<length>,...
+    Raises ValueError if what they asked for can't be played
+    """
+    parameters = query(path)
+    return parse_settings(parameters.get("grid", DEFAULT_SETTINGS[0]), parameters.get("fleet", DEFAULT_SETTINGS[1]))
+
+async def spectate(socket : websockets.asyncio.server.ServerConnection, code : str | None):
+    match = match_registry.by_code.get(code) if code != None else None
+    if match == None or match.closed:
+        await socket.send(Protocol.encode({"type": "error", "message": "There is no match with that code to spectate"}))
+        return
+
+    match.spectators.add(socket)
+    SPECTATORS.inc()
+    try:
+        #from here on the spectator only gets what changes, straight from broadcast_to_spectators
+        await socket.send(Protocol.encode(snapshot(match)))
+        waits = [asyncio.create_task(socket.wait_closed()), asyncio.create_task(match.finished.wait())]
+        await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        for task in waits: task.cancel()
+    finally:
+        match.spectators.discard(socket)
+        SPECTATORS.dec()
+
+async def proxy(socket : websockets.asyncio.server.ServerConnection, port : int, path : str, redirects : bool = False) -> str | None:
+    """
+    Passes every message between the client and another worker, at the given path, until either side closes.
+    If redirects is set the worker's first message can be a redirect instead, which ends the proxy and returns the path it gives
+    """
+    redirect = None
+    async def pump(source, destination, first_can_redirect : bool = False):
+        nonlocal redirect
+        try:
+            async for message in source:
+                if first_can_redirect:
+                    first_can_redirect = False
+                    if type(message) == str and (reply := Protocol.decode(message)).get("type") == "redirect":
+                        redirect = reply["path"]
+                        return
+                await destination.send(message)
+        except websockets.exceptions.ConnectionClosed: pass
+
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{port}{path}") as upstream:
+            pumps = [asyncio.create_task(pump(socket, upstream)), asyncio.create_task(pump(upstream, socket, redirects))]
+            await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            for task in pumps: task.cancel()
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        log.warning("could not reach another worker", extra={"port": port, "error": str(e)})
+    return redirect
+
+def reap(match : Match, player_id : int):
+    """
+    Cuts off a player's connection that has gone quiet, and stops listening to it
+    """
+    socket = match.connected_clients[player_id]
+    log.warning("reaping an idle connection", extra={"player": match.players[player_id], "match": match.match_id, "idle_for": round(time.monotonic() - match.last_seen[player_id], 1)})
+    IDLE_CONNECTIONS_REAPED.inc()
+    socket.transport.abort()
+    #the listener can be waiting on the match rather than the socket, so it might never notice the connection going
+    if match.listeners[player_id] != None: match.listeners[player_id].cancel()
+    #a dead connection gets its seat held like any other, in case the client is still out there
+    drop(match, player_id, socket)
+
+async def reap_idle_connections():
+    """
+    Pings every player whose client answers pings, and reaps any connection that hasn't been heard from in IDLE_TIMEOUT_SECONDS.
+    Clients that don't answer pings can go quiet for a whole turn, so once they've sent their username only the websocket's own pings watch them
+    """
+    interval = PING_INTERVAL_SECONDS or IDLE_TIMEOUT_SECONDS / 4
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        for match in list(match_registry.matches.values()):
+            for player_id, socket in enumerate(match.connected_clients):
+                if match.closed: break
+                #bots inside the server have no connection to lose
+                if socket == None or socket.transport == None: continue
+                heartbeat = "heartbeat" in match.features[player_id]
+                if not heartbeat and match.players[player_id] != None: continue
+                #a listener waiting for the other fleet isn't reading pongs, the websocket's pings still are
+                if match.players_ships[player_id] != None and not match.ships_placed.is_set(): continue
+                if IDLE_TIMEOUT_SECONDS and now - match.last_seen[player_id] > IDLE_TIMEOUT_SECONDS: reap(match, player_id)
+                elif heartbeat and PING_INTERVAL_SECONDS: send(match, player_id, {"type": "ping"})
 
 async def handle_client(socket : websockets.asyncio.server.ServerConnection):
-    global connected_clients
-    global players
-    global players_ships
-    global game_over
-
-    #Check the number of players isn't already too many
-    if len(connected_clients) >= MAX_PLAYERS:
-        await socket.send(json.dumps({"type": "error", "message": "Match full"}))
-        await socket.close()
-        print("Client attempted to connect, but match is full")
+    await route(socket, socket.request.path)
+
+async def route(socket : websockets.asyncio.server.ServerConnection, path : str):
+    """
+    Plays the connection here if this worker owns its match, or passes it to the worker that does.
+    Players without a code wait in the matchmaking worker's queue, which sends them back here with the code of the match it found them
+    """
+    code = match_code(path)
+    #spectators without a code have nothing to watch, whichever worker tells them so
+    if cluster != None and (code != None or not is_spectator(path)):
+        owner = cluster.owner_of(code)
+        if owner != cluster.index and code == None:
+            MATCHMAKING_RELAYS.inc()
+            path = await proxy(socket, cluster.internal_port(owner), f"{path}{'&' if '?' in path else '?'}via={cluster.index}", redirects=True)
+            if path == None: return
+            code = match_code(path)
+            owner = cluster.owner_of(code)
+        if owner != cluster.index:
+            ROUTED_CONNECTIONS.inc()
+            return await proxy(socket, cluster.internal_port(owner), path)
+    await handle_player(socket, path)
+
+async def handle_routed_client(socket : websockets.asyncio.server.ServerConnection):
+    await handle_player(socket, socket.request.path, relayed=True)
+
+async def handle_player(socket : websockets.asyncio.server.ServerConnection, path : str, relayed : bool = False):
+    CONNECTIONS.inc()
+    try: await play(socket, path, relayed)
+    finally: CONNECTIONS.dec()
+
+def welcome(match : Match, player_id : int) -> dict:
+    return {"type": "welcome", "player": player_id + 1, "match": match.code, "protocols": Protocol.SUPPORTED_PROTOCOLS, "resume": match.resume_tokens[player_id],
+            "grid_size": match.grid_size, "fleet": list(match.fleet)}
+
+async def play(socket : websockets.asyncio.server.ServerConnection, path : str, relayed : bool = False):
+    """
+    Plays the connection in a match on this worker. A relayed connection is one another worker is passing on
+    """
+    if is_spectator(path): return await spectate(socket, match_code(path))
+    token = resume_token(path)
+    if token != None: return await resume(socket, token)
+    try:
+        settings = requested_settings(path)
+        rating = requested_rating(path)
+    except ValueError as e:
+        await socket.send(Protocol.encode({"type": "error", "message": f"Invalid match settings: {e}"}))
         return
-    #Send the player a welcome message
-    connected_clients.append(socket)
-    player_id = len(connected_clients)
-    await socket.send(json.dumps({"type": "welcome", "player": player_id}))
-
-    asyncio.create_task(client_listner(socket))
-    while socket in connected_clients and None in players_ships: await asyncio.sleep(1)
-    while socket in connected_clients and players_ships[0] != [] and players_ships[1] != []: await asyncio.sleep(1)
-    game_over += 1
-    if players_ships[player_id - 1] == []: await socket.send(json.dumps({"type": "done", "result": 0})); print("Lost message")
-    if players_ships[2 - player_id] == []: await socket.send(json.dumps({"type": "done", "result": 1})); print("Win message")
-    if game_over == 2: game_over = 0; await disconnect(player_id - 1)
-
-async def start_server(port : int):
+    code = match_code(path)
+    #players with a code are waiting for someone in particular, everyone else waits for the matchmaking queue to find them someone
+    if code != None:
+        match, player_id = match_registry.join(socket, code, settings)
+        if player_id == 0 and "handover" in query(path): run_in_background(expire_handover(match))
+    else:
+        match, player_id, code = await queue_for_match(socket, settings, rating, query(path).get("region", ""), connected_worker(path, relayed))
+        if match == None:
+            if code == None: return
+            #the match is on another worker, where they meet their opponent with its code.
+            #the worker that passed them on here is told to take them there itself, so no connection goes through two others
+            handover = f"/{code}?{settings_query(settings)}&handover"
+            if relayed: return await socket.send(Protocol.encode({"type": "redirect", "path": handover}))
+            ROUTED_CONNECTIONS.inc()
+            return await proxy(socket, cluster.internal_port(cluster.owner_of(code)), handover)
+    #Send the player a welcome message, the match code is what spectators use to watch and the token is how they get back in
+    send(match, player_id, welcome(match, player_id))
+    await serve_player(match, player_id)
+
+async def queue_for_match(socket : websockets.asyncio.server.ServerConnection, settings : Settings, rating : float, region : str,
+                          first_worker : int | None = None) -> tuple[Match | None, int, str | None]:
+    """
+    Waits in the matchmaking queue for someone with a similar rating who asked for the same settings and region,
+    returning the match, their seat in it and its code, or only the code if the match is on another worker.
+    first_worker is where the player first connected, the match goes there if they waited longer than their opponent.
+    Gets a bot instead if nobody turns up within BOT_WAIT_SECONDS, and no match at all if the player leaves first
+    """
+    paired = asyncio.get_running_loop().create_future()
+    ticket = matchmaking_queue.join((socket, paired, first_worker), rating, (settings, region))
+    if not paired.done():
+        closed = asyncio.create_task(socket.wait_closed())
+        try: await asyncio.wait([paired, closed], timeout=BOT_WAIT_SECONDS or None, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            matchmaking_queue.leave(ticket)
+        if not paired.done():
+            if socket.state == websockets.protocol.State.CLOSED: return None, 0, None
+            match = match_registry.new_match(settings=settings)
+            player_id = match_registry.seat(match, socket)
+            run_in_background(seat_bot(match))
+            return match, player_id, match.code
+    return paired.result()
+
+async def expire_handover(match : Match):
+    """
+    Ends a match the matchmaking worker handed over if only one of the two players ever reaches it, so they aren't left waiting forever
+    """
+    await asyncio.sleep(HANDOVER_SECONDS)
+    if match.closed or not match.is_open(): return
+    log.warning("paired player never arrived", extra={"match": match.match_id, "code": match.code})
+    HANDOVERS_EXPIRED.inc()
+    for player_id in range(MAX_PLAYERS): send(match, player_id, {"type": "disconnection"})
+    match_registry.close(match)
+
+async def seat_bot(match : Match):
+    """
+    Fills the other seat of a match with a bot, playing inside this process
+    """
+    server_end, bot_end = Bot.local_pipe()
+    player_id = match_registry.seat(match, server_end)
+    BOT_MATCHES.inc()
+    log.info("seated a bot", extra={"match": match.match_id, "heatmap": "numpy" if Strategy.numpy != None else "python"})
+    send(match, player_id, welcome(match, player_id))
+    strategy = "heatmap" if match.grid_size <= Strategy.HEATMAP_MAX_GRID else "random"
+    bot = asyncio.create_task(Bot.play(bot_end, "Bot", strategy=strategy, think_time=BOT_THINK_SECONDS))
+    try: await serve_player(match, player_id)
+    finally:
+        await server_end.close()
+        await bot
+
+async def resume(socket : websockets.asyncio.server.ServerConnection, token : str):
+    match, player_id = match_registry.sessions.get(token, (None, None))
+    if match == None or match.closed:
+        await socket.send(Protocol.encode({"type": "error", "message": "That match can't be resumed"}))
+        return
+
+    if match.grace_timers[player_id] != None:
+        match.grace_timers[player_id].cancel()
+        match.grace_timers[player_id] = None
+    #the server may not have noticed the old connection break yet, the token says this one replaces it
+    old_socket = match.connected_clients[player_id]
+    match.attach(player_id, socket)
+    if old_socket != None: run_in_background(old_socket.close(1001, "Resumed elsewhere"))
+    SESSIONS.labels("resumed").inc()
+    log.info("player resumed", extra={"player": match.players[player_id], "match": match.match_id})
+    send(match, player_id, resume_snapshot(match, player_id))
+    await serve_player(match, player_id)
+
+async def serve_player(match : Match, player_id : int):
+    """
+    Listens to the player until their connection ends or the match does, whichever is first
+    """
+    outbox = match.outboxes[player_id]
+    listener = match.listeners[player_id] = asyncio.create_task(client_listner(match, player_id))
+    waits = [listener, asyncio.create_task(match.finished.wait())]
+    await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+    for task in waits: task.cancel()
+    if match.listeners[player_id] is listener: match.listeners[player_id] = None
+    #the last messages, like the result, still have to go out before the connection closes
+    if outbox != None: await outbox.close()
+
+#the websocket's own pings, which catch connections that died without closing, whatever the client understands
+KEEPALIVE = {"ping_interval": PING_INTERVAL_SECONDS or None, "ping_timeout": IDLE_TIMEOUT_SECONDS or None}
+
+async def start_server(port : int, metrics_port : int | None = None, host : str = "localhost", worker_cluster : Cluster | None = None):
     if type(port) != int: raise TypeError(f"You must supply a an integer port number, not: {port}")
-    print("Server up")
-    async with websockets.asyncio.server.serve(handle_client, "localhost", port) as server:
+    global cluster, match_log
+    cluster = worker_cluster
+    #every worker writes its own log, so no two processes append to the same file
+    log_directory = os.environ.get("SHIPWAR_MATCH_LOG_DIR", "match_logs")
+    if log_directory:
+        os.makedirs(log_directory, exist_ok=True)
+        match_log = MatchLog.MatchLogWriter(os.path.join(log_directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.shiplog"))
+        asyncio.create_task(flush_match_log())
+    if metrics_port:
+        await Metrics.start_metrics_server(host, metrics_port)
+        asyncio.create_task(Metrics.watch_event_loop_lag(LOOP_LAG_SECONDS))
+    if PING_INTERVAL_SECONDS or IDLE_TIMEOUT_SECONDS: asyncio.create_task(reap_idle_connections())
+    asyncio.create_task(matchmaking_queue.keep_sweeping())
+    if cluster != None:
+        await websockets.asyncio.server.serve(handle_routed_client, "127.0.0.1", cluster.internal_port(cluster.index), write_limit=SEND_BUFFER_HIGH_WATER, **KEEPALIVE)
+    log.info("server up", extra={"port": port, "metrics_port": metrics_port, "worker": cluster.index if cluster else None,
+                                 "json": Protocol.JSON_BACKEND, "event_loop": type(asyncio.get_running_loop()).__module__.partition(".")[0]})
+    async with websockets.asyncio.server.serve(handle_client, host, port, reuse_port=cluster != None, write_limit=SEND_BUFFER_HIGH_WATER, **KEEPALIVE) as server:
         await server.serve_forever()
 
-if __name__ == "__main__":
-    DEFAULT_PORT = 6363
-    MAX_PLAYERS = 2
-    global connected_clients
-    connected_clients : list[websockets.asyncio.server.ServerConnection] = []
-    global players
-    players : list = [None, None]
-    global players_ships
-    players_ships : list[list[list[list[int, int]]]] = [None, None]
-    global game_over
-    game_over = 0
+def run_event_loop(main):
+    """
+    Runs the server on uvloop if it's installed, and on asyncio's own loop if it isn't
+    """
+    if uvloop != None: return uvloop.run(main)
+    return asyncio.run(main)
+
+def run_worker(index : int, workers : int, port : int, metrics_port : int, host : str, internal_base_port : int):
+    ShipWarLog.setup_logging()
+    #each worker keeps its own metrics, so each gets its own port
+    run_event_loop(start_server(port, metrics_port + index if metrics_port else None, host, Cluster(index, workers, internal_base_port)))
+
+def run_supervisor(workers : int, port : int, metrics_port : int, host : str, internal_base_port : int):
+    """
+    Starts a worker process per core, all sharing the public port, and restarts any that die
+    """
+    context = multiprocessing.get_context("spawn")
+    def start_worker(index : int) -> multiprocessing.Process:
+        process = context.Process(target=run_worker, args=(index, workers, port, metrics_port, host, internal_base_port), daemon=True)
+        process.start()
+        return process
 
+    processes = [start_worker(index) for index in range(workers)]
+    log.info("supervisor up", extra={"workers": workers, "port": port, "internal_ports": f"{internal_base_port}-{internal_base_port + workers - 1}"})
+    try:
+        while True:
+            multiprocessing.connection.wait([process.sentinel for process in processes])
+            for index, process in enumerate(processes):
+                if process.is_alive(): continue
+                log.warning("worker died, restarting it", extra={"worker": index, "exit_code": process.exitcode})
+                processes[index] = start_worker(index)
+    finally:
+        for process in processes: process.terminate()
+
+def run(port : int, metrics_port : int):
+    host = os.environ.get("SHIPWAR_HOST", "localhost")
+    workers = os.environ.get("SHIPWAR_WORKERS", "1")
+    workers = (os.cpu_count() or 1) if workers == "auto" else int(workers)
+    if workers > 1 and not hasattr(sockets, "SO_REUSEPORT"):
+        log.warning("this system can't share a port between processes, running a single worker")
+        workers = 1
+    if workers > 1: run_supervisor(workers, port, metrics_port, host, int(os.environ.get("SHIPWAR_INTERNAL_PORT", port + 1)))
+    else: run_event_loop(start_server(port, metrics_port, host))
+
+if __name__ == "__main__":
+    ShipWarLog.setup_logging()
+    #0 turns the metrics endpoint off
+    metrics_port = int(os.environ.get("SHIPWAR_METRICS_PORT", DEFAULT_METRICS_PORT))
     try:
         if sys.argv[1] != "Docker": 1/0
         #this means the server is running in a docker container
-        asyncio.run(start_server(DEFAULT_PORT))
+        run(DEFAULT_PORT, metrics_port)
     except:
         port = 0
         while True:
@@ -176,4 +913,4 @@ if __name__ == "__main__":
         if ips == 0: print(ips)
         else: print(os.system('ifconfig | grep inet"'))
         print(f"Port: {port}")
-        asyncio.run(start_server(port))
\ No newline at end of file
+        run(port, metrics_port)
\ No newline at end of file
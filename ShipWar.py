@@ -3,31 +3,140 @@ import pygame
 import asyncio
 import pygame.gfxdraw
 import websockets
-import json
 import pygameWidgets
+import Protocol
+import ShipWarLog
+import logging
+
+log = ShipWarLog.get_logger("client")
+#the board the server plays on if it doesn't say otherwise
+DEFAULT_GRID_SIZE = 10
+DEFAULT_FLEET = [2, 3, 3, 4, 5]
+#how many times to try picking a match back up after the connection drops, waiting longer each time
+RESUME_ATTEMPTS = 6
+#the most cells shown across a board at once, bigger boards are scrolled around with the arrow keys or mouse wheel
+MAX_VISIBLE_CELLS = 10
+
+def visible_cells() -> int:
+    return min(GRID_SIZE, MAX_VISIBLE_CELLS)
 
 def get_cell_size(screen : pygame.Surface, padding : int):
-    global GRID_SIZE
-    return int(min(screen.get_width() / 2 - 2 * padding, screen.get_height() - 4 * padding) // GRID_SIZE)
+    return int(min(screen.get_width() / 2 - 2 * padding, screen.get_height() - 4 * padding) // visible_cells())
+
+def scroll_view(rows : int, cols : int) -> bool:
+    """
+    Moves the part of the board on screen, without going past its edges. Returns whether it moved
+    """
+    global view_origin
+    furthest = GRID_SIZE - visible_cells()
+    new_origin = [min(max(view_origin[0] + rows, 0), furthest), min(max(view_origin[1] + cols, 0), furthest)]
+    if new_origin == view_origin: return False
+    view_origin = new_origin
+    return True
 
-async def listen_to_server(socket: websockets.ClientConnection) -> None:
-    global error_message, user_guessed_squares, enemy_guessed_squares, player_id, enemy_name, still_playing, players_turn
+def scroll_event(event : pygame.event.Event) -> bool:
+    """
+    Scrolls the board for arrow keys and the mouse wheel, holding shift with the wheel goes sideways. Returns whether it moved
+    """
+    if event.type == pygame.KEYDOWN:
+        steps = {pygame.K_UP: (-1, 0), pygame.K_DOWN: (1, 0), pygame.K_LEFT: (0, -1), pygame.K_RIGHT: (0, 1)}.get(event.key)
+        if steps: return scroll_view(*steps)
+    elif event.type == pygame.MOUSEWHEEL:
+        if pygame.key.get_mods() & pygame.KMOD_SHIFT: return scroll_view(0, -event.y)
+        return scroll_view(-event.y, event.x)
+    return False
+
+def cell_label(index : int) -> str:
+    #letters run out past 26 rows
+    return "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[index] if GRID_SIZE <= 26 else f"{index + 1}"
+
+def mark_cells(squares : dict[tuple[int, int], int], cells : list[list[int]], value : int) -> None:
+    for cell in cells: squares[tuple(cell)] = value
+
+def apply_resume_snapshot(reply : dict) -> None:
+    """
+    Redraws both boards from what the server sent back when the match was resumed
+    """
+    global user_guessed_squares, enemy_guessed_squares, enemy_name, players_turn
+    if reply["opponent"] != None: enemy_name = reply["opponent"]
+    players_turn = reply["turn"]
+    for squares, board in ((enemy_guessed_squares, reply["board"]), (user_guessed_squares, reply["radar"])):
+        if board == None: continue
+        mark_cells(squares, board["misses"], 1)
+        mark_cells(squares, board["hits"], 2)
+        for ship in board["sunk"]: mark_cells(squares, ship, 3)
+
+async def resume_session() -> bool:
+    """
+    Reconnects with the token from the welcome message, and swaps the new connection in if the server still has the match
+    """
+    global server_socket
+    for attempt in range(RESUME_ATTEMPTS):
+        await asyncio.sleep(min(0.5 * 2 ** attempt, 8))
+        try:
+            socket = await websockets.connect(f"ws://{server_ip}:{server_port}/{match_code}?resume={resume_token}")
+            reply = Protocol.decode(await socket.recv())
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            log.info("resume attempt failed", extra={"attempt": attempt + 1, "error": str(e)})
+            continue
+        if reply["type"] != "resumed":
+            await socket.close()
+            return False
+        apply_resume_snapshot(reply)
+        server_socket = socket
+        log.info("resumed match", extra={"match": match_code})
+        return True
+    return False
+
+async def send_to_server(message : dict) -> None:
+    """
+    Sends on the current connection, waiting out a resume if the connection has just dropped
+    """
+    socket = server_socket
+    try: await socket.send(Protocol.encode(message, protocol))
+    except websockets.exceptions.ConnectionClosedError:
+        if not resume_token: raise
+        #the listener notices the same drop and swaps in a new connection, unless it gives up
+        while server_socket is socket and not error_message: await asyncio.sleep(0.1)
+        if server_socket is socket: raise
+        await server_socket.send(Protocol.encode(message, protocol))
+
+async def listen_to_server() -> None:
+    global error_message, user_guessed_squares, enemy_guessed_squares, player_id, enemy_name, still_playing, players_turn, protocol, resume_token, match_code, GRID_SIZE, FLEET
     while still_playing:
         try:
-            reply = json.loads(await socket.recv())
-            print("Received:", reply)
+            reply = Protocol.decode(await server_socket.recv())
+            if log.isEnabledFor(logging.DEBUG): log.debug("received", extra={"sampled": True, "reply": reply})
             if reply["type"] == "welcome":
                 player_id = int(reply["player"])
                 if player_id != 1: players_turn = False
+                #servers that predate the binary protocol don't list any, and get plain JSON
+                protocol = Protocol.choose_protocol(reply.get("protocols"))
+                #servers that can't resume a match don't send a token
+                resume_token = reply.get("resume")
+                match_code = reply.get("match")
+                #servers from before boards could be resized don't say, and always use the standard board
+                GRID_SIZE = int(reply.get("grid_size", DEFAULT_GRID_SIZE))
+                FLEET = list(reply.get("fleet", DEFAULT_FLEET))
+                await server_socket.send(Protocol.encode({"type":"username", "name": player_name, "protocol": protocol, "features": Protocol.SUPPORTED_FEATURES}))
             elif reply["type"] == "username":
                 enemy_name = reply["name"]
                 still_playing.set()
             elif reply["type"] == "guess_result":
-                user_guessed_squares[reply["position"][0]][reply["position"][1]] = reply["result"]
+                user_guessed_squares[tuple(reply["position"])] = reply["result"]
                 players_turn = False
             elif reply["type"] == "enemy_guess_result":
-                enemy_guessed_squares[reply["position"][0]][reply["position"][1]] = reply["result"]
+                enemy_guessed_squares[tuple(reply["position"])] = reply["result"]
+                players_turn = True
+            elif reply["type"] == "ship_sunk":
+                mark_cells(user_guessed_squares, reply["cells"], 3)
+                players_turn = False
+            elif reply["type"] == "enemy_ship_sunk":
+                mark_cells(enemy_guessed_squares, reply["cells"], 3)
                 players_turn = True
+            elif reply["type"] == "ping":
+                #the server takes a client that stops answering for one that has gone
+                await server_socket.send(Protocol.encode({"type": "pong"}))
             elif reply["type"] == "done":
                 if reply["result"] == 1: error_message = "w"
                 else: error_message = "l"
@@ -41,25 +150,28 @@ async def listen_to_server(socket: websockets.ClientConnection) -> None:
             else:
                 error_message = f"Unexpected message type: {reply['type']}"
                 return
+        except websockets.exceptions.ConnectionClosedError as e:
+            #a dropped connection gets a few tries at picking the match back up before it counts as an error
+            if resume_token and await resume_session(): continue
+            error_message = f"Error received from server: {e}"
+            return
         except Exception as e:
             error_message = f"Error received from server: {e}"
             return
 
 #Server connection logic
 async def handle_server():
-    global guess, error_message, server_ip, server_port, still_playing, player_name, player_id, enemy_name, ships_placed, ship_objs
+    global guess, error_message, server_ip, server_port, still_playing, player_name, player_id, enemy_name, ships_placed, ship_objs, server_socket
 
     #connect to the server
     try:
-        ws_connection = await websockets.connect("ws://" + str(server_ip) + ":" + str(server_port))
+        server_socket = await websockets.connect("ws://" + str(server_ip) + ":" + str(server_port) + settings_query())
     except Exception as e:
         error_message = f"Could not connect to server: {str(e)}"
         return
     
-    #Add server event listener
-    asyncio.create_task(listen_to_server(ws_connection))
-
-    await ws_connection.send(json.dumps({"type":"username", "name": player_name}))
+    #Add server event listener, it sends our username once the server has welcomed us
+    asyncio.create_task(listen_to_server())
 
     #When ready to send the ships, send them
     await ships_placed.wait()
@@ -69,10 +181,11 @@ async def handle_server():
             curr_ship_locations : list[list[int, int]] = []
             for col in ship.blocks:
                 for block in col:
-                    cell_numbers = [(block.topleft[1] - ship.grid_origin[1]) / ship.cell_size, (block.topleft[0] - ship.grid_origin[0]) / ship.cell_size]
+                    #each ship is placed on the part of the board that was on screen when it was put down
+                    cell_numbers = [ship.view_origin[0] + round((block.topleft[1] - ship.grid_origin[1]) / ship.cell_size), ship.view_origin[1] + round((block.topleft[0] - ship.grid_origin[0]) / ship.cell_size)]
                     curr_ship_locations.append(cell_numbers)
             message.append(curr_ship_locations)
-        await ws_connection.send(json.dumps({"type":"ships", "message": message}))
+        await send_to_server({"type":"ships", "message": message})
     except Exception as e:
         error_message = f"Failed to send ship locations to server. Error: {str(e)}"
         return
@@ -86,15 +199,15 @@ async def handle_server():
         if guess:
             #Tell server guess
             try:
-                await ws_connection.send(json.dumps({"type":"guess", "position": [int(guess[0]), int(guess[1])]}))
+                await send_to_server({"type":"guess", "position": [int(guess[0]), int(guess[1])]})
             except Exception as e:
                 error_message = f"Failed to send guess: {str(e)}"
                 return
             
             guess = False
 
-    await ws_connection.send(json.dumps({"type":"disconnection"}))
-    await ws_connection.close()
+    await server_socket.send(Protocol.encode({"type":"disconnection"}))
+    await server_socket.close()
     still_playing.clear()
 
 def display_win_message(screen : pygame.Surface) -> None:
@@ -163,7 +276,7 @@ def display_lose_message(screen : pygame.Surface) -> None:
                     pygame.quit()
                     return
 
-def setup_game_board(padding) -> tuple[list[list[pygameWidgets.Button]], pygameWidgets.Button, list[list[pygameWidgets.Button]]]:
+def setup_game_board(padding) -> tuple[pygameWidgets.Grid, pygameWidgets.Button, pygameWidgets.Grid]:
     global enemy_name
     global player_name
 
@@ -177,23 +290,25 @@ def setup_game_board(padding) -> tuple[list[list[pygameWidgets.Button]], pygameW
     player_username_text.draw()
 
     # Left board - Radar (shots fired)
-    radar_buttons, guess_button = setup_grid(LEFT_TOP=(0, padding // 2), title="Radar", label=True, font_size=font_size, padding=padding, interactable=True, guessed=user_guessed_squares)
+    radar_grid, guess_button = setup_grid(LEFT_TOP=(0, padding // 2), title="Radar", label=True, font_size=font_size, padding=padding, interactable=True, guessed=user_guessed_squares)
+    radar_grid.draw()
 
     # Right board - Player'submarine_ship ships
     right_x = __SCREEN.get_width() // 2
-    enemy_buttons = setup_grid(LEFT_TOP=(right_x, padding // 2), title="Game Board", label=True, font_size=font_size, padding=padding, guessed=enemy_guessed_squares)[0]
+    enemy_grid = setup_grid(LEFT_TOP=(right_x, padding // 2), title="Game Board", label=True, font_size=font_size, padding=padding, guessed=enemy_guessed_squares)[0]
+    enemy_grid.draw()
 
-    return radar_buttons, guess_button, enemy_buttons
+    return radar_grid, guess_button, enemy_grid
 
-def draw_grid(buttons : list[list[pygameWidgets.Button]], padding : int, guess_button : pygameWidgets.Button = None, guessed=None, allowed_to_guess = False):
+def draw_grid(grid : pygameWidgets.Grid, padding : int, guess_button : pygameWidgets.Button = None, guessed=None, allowed_to_guess = False):
     can_guess = False
-    circle_radius = get_cell_size(__SCREEN, padding) // 8
-    for row in range(GRID_SIZE):
-        for col in range(GRID_SIZE):
-            cx, cy = map(int, buttons[row][col].center)
+    circle_radius = grid.cell_size // 8
+    for row in range(grid.cells):
+        for col in range(grid.cells):
+            cx, cy = grid.cell_center(row, col)
 
-            if guessed:
-                match guessed[row][col]:
+            if guessed != None:
+                match guessed.get((view_origin[0] + row, view_origin[1] + col), 0):
                     case 0: pygame.gfxdraw.filled_circle(__SCREEN, cx, cy, circle_radius, (80, 80, 80)) # grey for base color
                     case 1: pygame.gfxdraw.filled_circle(__SCREEN, cx, cy, circle_radius, (255, 255, 255)) # white for miss
                     case 2: pygame.gfxdraw.filled_circle(__SCREEN, cx, cy, circle_radius, (255, 165, 0)) # orange for hit, but not sink/sunk
@@ -205,48 +320,27 @@ def draw_grid(buttons : list[list[pygameWidgets.Button]], padding : int, guess_b
         guess_button.draw()
 
 def setup_grid(LEFT_TOP, title="", label=False, font_size : int = 24, padding=0, 
-              interactable=False, guessed=None) -> tuple[list[list[pygameWidgets.Button]], pygameWidgets.Button | None]:
+              interactable=False, guessed=None) -> tuple[pygameWidgets.Grid, pygameWidgets.Button | None]:
+    """
+    Builds the part of a board on screen, which only needs doing again when the window is resized or the board is scrolled
+    """
     CELL_SIZE = get_cell_size(__SCREEN, padding)
-    grid_px = CELL_SIZE * GRID_SIZE
-
-    # Title
-    if title:
-        title_text = pygameWidgets.Text(__SCREEN, title, (LEFT_TOP[0] + grid_px // 2 + padding, LEFT_TOP[1] + padding // 2), font_size=font_size)
-        title_text.draw()
-
-    buttons = [[None] * GRID_SIZE for i in range(GRID_SIZE)]
-
-    def get_inverse_scaled_size(target_scaled_size: int, scale_reference=(1280, 700), current_size=None) -> float:
-        current_size = current_size or __SCREEN.get_size()
-        scale_factor = min(current_size[0] / scale_reference[0], current_size[1] / scale_reference[1])
-        return round(target_scaled_size / scale_factor)
-
-    inverted_scaled_cell_size = get_inverse_scaled_size(CELL_SIZE)
-
-    # Grid buttons and pegs
-    for row in range(GRID_SIZE):
-        for col in range(GRID_SIZE):
-            #buttons
-            button = pygameWidgets.Button(__SCREEN, "", inverted_scaled_cell_size, [title_text.center[0] - grid_px // 2 + (col + 0.5) * CELL_SIZE, title_text.rect.bottom + title_text.rect.height + (row + 0.5) * CELL_SIZE], 
-                                          fixed_height=True, fixed_width=True, border_color=(100, 100, 100))
-            button.draw()
-            buttons[row][col] = button
-        
+    cells = visible_cells()
+    grid_px = CELL_SIZE * cells
+
     #Write board locations:
-    if label: 
-        for i in range(GRID_SIZE):
-            row_num = pygameWidgets.Text(__SCREEN, f"ABCDEFGHIJKLMNOPQRSTUVWXYZ"[i], [title_text.center[0] - grid_px // 2 - padding // 2, title_text.rect.bottom + title_text.rect.height + (i + 0.5) * CELL_SIZE])
-            row_num.draw()
+    row_labels = [cell_label(view_origin[0] + i) for i in range(cells)] if label else []
+    col_labels = [f"{view_origin[1] + i + 1}" for i in range(cells)] if label else []
 
-            col_num = pygameWidgets.Text(__SCREEN, f"{i + 1}", [title_text.center[0] - grid_px // 2 + (i + 0.5) * CELL_SIZE, title_text.rect.bottom + title_text.rect.height - padding // 2])
-            col_num.draw()
+    grid = pygameWidgets.Grid(__SCREEN, (LEFT_TOP[0] + grid_px // 2 + padding, LEFT_TOP[1] + padding // 2), CELL_SIZE, cells, title,
+                              row_labels, col_labels, font_size, padding // 2)
     
     #Confirm guess button
-    if interactable and guessed:
-        guess_button = pygameWidgets.Button(__SCREEN, "Confirm", 20, [title_text.center[0], title_text.rect.bottom + title_text.rect.height + grid_px + 0.75 * padding], "grey")
-        guess_button.draw()
+    guess_button = None
+    if interactable and guessed != None:
+        guess_button = pygameWidgets.Button(__SCREEN, "Confirm", 20, [grid.grid_rect.centerx, grid.grid_rect.bottom + 0.75 * padding], "grey")
 
-    return buttons, guess_button if interactable else None
+    return grid, guess_button
 
 def draw_menu() -> tuple[pygameWidgets.Button, pygameWidgets.Button, pygameWidgets.Button]:
     global __SCREEN
@@ -280,7 +374,7 @@ def draw_menu() -> tuple[pygameWidgets.Button, pygameWidgets.Button, pygameWidge
 
     return play_button, settings_button, quit_button
 
-def draw_settings_menu(player_name_entry_field : pygameWidgets.EntryField) -> tuple[pygameWidgets.EntryField, pygameWidgets.Button, pygameWidgets.Button]:
+def draw_settings_menu(entry_fields : list[pygameWidgets.EntryField]) -> tuple[list[pygameWidgets.EntryField], pygameWidgets.Button, pygameWidgets.Button]:
     global __SCREEN
 
     __SCREEN.fill("black")
@@ -293,8 +387,10 @@ def draw_settings_menu(player_name_entry_field : pygameWidgets.EntryField) -> tu
     #Entry Fields
     title_entry_field_dist = pygameWidgets.get_scaled_size(50)
 
-    player_name_entry_field.center = (__SCREEN.get_width() // 2, title.center[1] + title_padding + title_entry_field_dist)
-    player_name_entry_field.draw()
+    entry_entry_field_dist = pygameWidgets.get_scaled_size(60)
+    for i, entry_field in enumerate(entry_fields):
+        entry_field.center = (__SCREEN.get_width() // 2, title.center[1] + title_padding + title_entry_field_dist + i * entry_entry_field_dist)
+        entry_field.draw()
 
     #Buttons
     entry_button_dist = pygameWidgets.get_scaled_size(70)
@@ -304,7 +400,7 @@ def draw_settings_menu(player_name_entry_field : pygameWidgets.EntryField) -> tu
     button_width = pygameWidgets.get_scaled_size(250)
 
     save_button = pygameWidgets.Button(__SCREEN, "Save", (button_width, button_padding), 
-                                  (__SCREEN.get_width() // 2, player_name_entry_field.center[1] + player_name_entry_field.rect.height + entry_button_dist), 
+                                  (__SCREEN.get_width() // 2, entry_fields[-1].center[1] + entry_fields[-1].rect.height + entry_button_dist), 
                                   fixed_width=True, color="blue", font_size=24)
     back_button = pygameWidgets.Button(__SCREEN, "Back", (button_width, button_padding), 
                               (__SCREEN.get_width() // 2, save_button.center[1] + button_padding + button_button_y_dist), 
@@ -313,16 +409,26 @@ def draw_settings_menu(player_name_entry_field : pygameWidgets.EntryField) -> tu
     save_button.draw()
     back_button.draw()
 
-    return player_name_entry_field, save_button, back_button
+    return entry_fields, save_button, back_button
+
+def settings_query() -> str:
+    """
+    The board size and fleet to ask the server for, as the end of its URL. Nothing means whatever the server plays by default
+    """
+    parameters = [f"{name}={value}" for name, value in (("grid", requested_grid_size), ("fleet", requested_fleet)) if value]
+    return "?" + "&".join(parameters) if parameters else ""
 
 def settings() -> None:
     global error_message
-    global player_name
+    global player_name, requested_grid_size, requested_fleet
 
     player_name_entry_field = pygameWidgets.EntryField(__SCREEN, (0, 0), "Player Name: ", font_size=26, title_field_dist=20, input_padding=20, width=250, input_text=player_name)
+    grid_size_entry_field = pygameWidgets.EntryField(__SCREEN, (0, 0), "Grid Size: ", font_size=26, title_field_dist=20, input_padding=20, width=250, input_text=requested_grid_size)
+    fleet_entry_field = pygameWidgets.EntryField(__SCREEN, (0, 0), "Fleet: ", font_size=26, title_field_dist=20, input_padding=20, width=250, input_text=requested_fleet)
+    entry_fields = [player_name_entry_field, grid_size_entry_field, fleet_entry_field]
     
     while not error_message:
-        player_name_entry_field, save_button, back_button = draw_settings_menu(player_name_entry_field)
+        entry_fields, save_button, back_button = draw_settings_menu(entry_fields)
         pygame.display.flip()
 
         for event in pygame.event.get():
@@ -331,33 +437,36 @@ def settings() -> None:
                 return
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 #Entry Fields
-                player_name_entry_field.pressed(event.pos)
+                for entry_field in entry_fields: entry_field.pressed(event.pos)
                 #Buttons
                 if save_button.pressed(event.pos):
                     player_name = player_name_entry_field.input.inner_text
+                    #the server checks these, and says what's wrong when the match starts
+                    requested_grid_size = grid_size_entry_field.input.inner_text.strip()
+                    requested_fleet = fleet_entry_field.input.inner_text.replace(" ", "")
                 elif back_button.pressed(event.pos): return
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE: return
             elif event.type == pygame.KEYDOWN:
-                player_name_entry_field.type(event)
+                for entry_field in entry_fields: entry_field.type(event)
 
-def send_ship_locations(ship_2 : pygameWidgets.Ship, ship_3a : pygameWidgets.Ship, ship_3b : pygameWidgets.Ship, ship_4 : pygameWidgets.Ship, ship_5 : pygameWidgets.Ship) -> True:
+def send_ship_locations(ships : list[pygameWidgets.Ship]) -> True:
     global ships_placed
     global ship_objs
 
-    ship_objs = [ship_2, ship_3a, ship_3b, ship_4, ship_5]
+    ship_objs = ships
     ships_placed.set()
 
     return True
 
 def validate_ship_positions(ships : list[pygameWidgets.Ship]) -> bool:
-    #Some input validation to ensure that all the ships locations are valid/on the board
-    global GRID_SIZE
+    #Some input validation to ensure that all the ships have been put down on the board, and none of them hang off its edges
     def to_grid_location(ship : pygameWidgets.Ship, i : int, y_not_x = False):
         e = (i - ship.grid_origin[y_not_x]) / ship.cell_size
-        print(e)
-        return int(e)
+        if log.isEnabledFor(logging.DEBUG): log.debug("ship grid location", extra={"sampled": True, "location": e})
+        return ship.view_origin[not y_not_x] + round(e)
 
     for ship in ships:
+        if ship.view_origin == None or ship.being_held: return False
         ship._calc_rect()
         if (to_grid_location(ship, ship.border_rect.left) < 0 or to_grid_location(ship, ship.border_rect.top, 1) < 0 or
             to_grid_location(ship, ship.border_rect.left) + abs(ship.dimensions[0]) - 1 > GRID_SIZE - 1 or
@@ -380,20 +489,23 @@ async def place_pieces() -> None:
 
     pieces_title = pygameWidgets.Text(__SCREEN, "Pieces", pieces_title_center_calc(), font_size=24)
     confirm_button = pygameWidgets.Button(__SCREEN, "Confirm", 0, confirm_button_center_calc())
-    destroyer_ship = pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + __SCREEN.get_height() // 6), 1, [2, 1])
-    submarine_ship = pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + 2 * __SCREEN.get_height() // 6), 1, [3, 1])
-    cruiser_ship = pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + 3 * __SCREEN.get_height() // 6), 1, [3, 1])
-    battleship_ship = pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + 4 * __SCREEN.get_height() // 6), 1, [4, 1])
-    carrier_ship = pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + 5 * __SCREEN.get_height() // 6), 1, [5, 1])
+    #one piece for each ship in the match's fleet, spread down the side of the screen
+    ships = [pygameWidgets.Ship(__SCREEN, (pieces_title.center[0], starting_ship_y_padding + (i + 1) * __SCREEN.get_height() // (len(FLEET) + 1)), 1, [length, 1])
+             for i, length in enumerate(FLEET)]
 
+    grid_built_for = None
     while not error_message:
         await asyncio.sleep(1/60)
 
-        valid_ship_positions = validate_ship_positions([destroyer_ship, submarine_ship, cruiser_ship, battleship_ship, carrier_ship])
+        valid_ship_positions = validate_ship_positions(ships)
 
         __SCREEN.fill("black")
 
-        grid_buttons = setup_grid((0, 0), "Your Board", True, padding=padding_calc())
+        #the board only changes when the window is resized or scrolled, so most frames it's just drawn again
+        if grid_built_for != (__SCREEN.get_size(), tuple(view_origin)):
+            grid = setup_grid((0, 0), "Your Board", True, padding=padding_calc())[0]
+            grid_built_for = (__SCREEN.get_size(), tuple(view_origin))
+        grid.draw()
 
         pygame.draw.line(__SCREEN, "white", dividing_line_start_point_calc(), dividing_line_end_point_calc(), 1)
 
@@ -406,26 +518,14 @@ async def place_pieces() -> None:
         confirm_button.center = confirm_button_center_calc()
         confirm_button.draw()
 
-        ship_cell_size = get_cell_size(__SCREEN, padding_calc())
-        destroyer_ship.cell_size = ship_cell_size
-        submarine_ship.cell_size = ship_cell_size
-        cruiser_ship.cell_size = ship_cell_size
-        battleship_ship.cell_size = ship_cell_size                
-        carrier_ship.cell_size = ship_cell_size                                                
-        
-        ship_grid_origin = grid_buttons[0][0][0].rect.topleft
-        destroyer_ship.grid_origin = ship_grid_origin
-        submarine_ship.grid_origin = ship_grid_origin
-        cruiser_ship.grid_origin = ship_grid_origin
-        battleship_ship.grid_origin = ship_grid_origin
-        carrier_ship.grid_origin = ship_grid_origin
-
-        destroyer_ship.draw()
-        submarine_ship.draw()
-        cruiser_ship.draw()
-        battleship_ship.draw()                
-        carrier_ship.draw()
-        
+        for ship in ships:
+            ship.cell_size = grid.cell_size
+            ship.grid_origin = grid.origin
+            ship.move_view(view_origin)
+            #ships that have been put down are cut off at the edges of the board, the parts of them scrolled away aren't on screen
+            if ship.view_origin != None and not ship.being_held: __SCREEN.set_clip(grid.grid_rect)
+            ship.draw()
+            __SCREEN.set_clip(None)
 
         pygame.display.flip()
         for event in pygame.event.get():
@@ -436,29 +536,25 @@ async def place_pieces() -> None:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE: return False
             if event.type == pygame.MOUSEBUTTONDOWN: 
                 if confirm_button.pressed(event.pos) and valid_ship_positions: 
-                    send_ship_locations(destroyer_ship, submarine_ship, cruiser_ship, battleship_ship, carrier_ship)
+                    send_ship_locations(ships)
                     return True
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 or event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-                if destroyer_ship.flip_dragging(event): continue
-                if submarine_ship.flip_dragging(event): continue
-                if cruiser_ship.flip_dragging(event): continue
-                if battleship_ship.flip_dragging(event): continue
-                carrier_ship.flip_dragging(event)
+                for ship in ships:
+                    if not ship.flip_dragging(event): continue
+                    #a ship put down on the board remembers which part of it was on screen, so it stays on the same cells while scrolling
+                    if not ship.being_held:
+                        ship._calc_rect()
+                        ship.view_origin = list(view_origin) if grid.grid_rect.colliderect(ship.border_rect) else None
+                    break
                 
             if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                destroyer_ship.rotate(event)
-                submarine_ship.rotate(event)
-                cruiser_ship.rotate(event)
-                battleship_ship.rotate(event)
-                carrier_ship.rotate(event)
+                for ship in ships: ship.rotate(event)
+            #on a board bigger than the screen, scrolling while holding a ship carries it to another part of the board
+            scroll_event(event)
                 
-        #if mouse'submarine_ship left button is held down
+        #if mouse's left button is held down
         if pygame.mouse.get_pressed()[0]:
-            destroyer_ship.drag(pygame.mouse.get_pos())
-            submarine_ship.drag(pygame.mouse.get_pos())
-            cruiser_ship.drag(pygame.mouse.get_pos())
-            battleship_ship.drag(pygame.mouse.get_pos())
-            carrier_ship.drag(pygame.mouse.get_pos())
+            for ship in ships: ship.drag(pygame.mouse.get_pos())
             
 
 async def game() -> None:
@@ -469,12 +565,16 @@ async def game() -> None:
     global players_turn
     last_guess = []
 
-    global GRID_SIZE
-    GRID_SIZE = 10
+    #the real board size and fleet come in the welcome message
+    global GRID_SIZE, FLEET, view_origin
+    GRID_SIZE = DEFAULT_GRID_SIZE
+    FLEET = DEFAULT_FLEET
+    view_origin = [0, 0]
+    #only the cells that have been shot at are kept, keyed by (row, col), so a huge board costs nothing until it's played on
     global user_guessed_squares
-    user_guessed_squares = [[0] * GRID_SIZE for i in range(GRID_SIZE)]
+    user_guessed_squares = {}
     global enemy_guessed_squares
-    enemy_guessed_squares = [[0] * GRID_SIZE for i in range(GRID_SIZE)]
+    enemy_guessed_squares = {}
 
     asyncio.create_task(handle_server())
 
@@ -490,15 +590,15 @@ async def game() -> None:
     if (await place_pieces()) == False: return
     
 
-    radar_buttons, guess_button, enemy_buttons = setup_game_board(pygameWidgets.get_scaled_size(50))
+    radar_grid, guess_button, enemy_grid = setup_game_board(pygameWidgets.get_scaled_size(50))
 
     while not error_message and still_playing.is_set():
         # Draw the sprites
         await asyncio.sleep(1/60)
 
         #update boards
-        draw_grid(radar_buttons, pygameWidgets.get_scaled_size(50), guess_button, user_guessed_squares, allowed_to_guess=players_turn)
-        draw_grid(enemy_buttons, pygameWidgets.get_scaled_size(50), guessed=enemy_guessed_squares)
+        draw_grid(radar_grid, pygameWidgets.get_scaled_size(50), guess_button, user_guessed_squares, allowed_to_guess=players_turn)
+        draw_grid(enemy_grid, pygameWidgets.get_scaled_size(50), guessed=enemy_guessed_squares)
 
         # Update the display
         pygame.display.flip()
@@ -516,15 +616,17 @@ async def game() -> None:
                 if event.size[1] < minimum_window_size: event.size = (event.size[0], minimum_window_size)
                 __SCREEN = pygame.display.set_mode(event.size, pygame.RESIZABLE)
 
-                radar_buttons, guess_button, enemy_buttons = setup_game_board(pygameWidgets.get_scaled_size(50))
+                radar_grid, guess_button, enemy_grid = setup_game_board(pygameWidgets.get_scaled_size(50))
+            elif scroll_event(event):
+                radar_grid, guess_button, enemy_grid = setup_game_board(pygameWidgets.get_scaled_size(50))
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                for row in range(len(radar_buttons)):
-                    for col in range(len(radar_buttons[row])):
-                        if radar_buttons[row][col].pressed(event.pos):
-                            if user_guessed_squares[row][col] != 0: break
-                            if last_guess and user_guessed_squares[last_guess[0]][last_guess[1]] == 4: user_guessed_squares[last_guess[0]][last_guess[1]] = 0
-                            last_guess = [row, col]
-                            user_guessed_squares[row][col] = 4
+                clicked = radar_grid.cell_at(event.pos)
+                #the grid only knows the cells on screen, the view says where they are on the whole board
+                cell = (view_origin[0] + clicked[0], view_origin[1] + clicked[1]) if clicked else None
+                if cell and user_guessed_squares.get(cell, 0) == 0:
+                    if last_guess and user_guessed_squares.get(tuple(last_guess)) == 4: del user_guessed_squares[tuple(last_guess)]
+                    last_guess = list(cell)
+                    user_guessed_squares[cell] = 4
                 if last_guess and guess_button.pressed(event.pos) and players_turn:
                     guess = [last_guess[0], last_guess[1]]
                     await asyncio.sleep(0)
@@ -632,12 +734,20 @@ if __name__ == "__main__":
     global player_id
     player_id = 0
 
+    global protocol
+    protocol = Protocol.JSON
+
     global guess
     guess = False
 
     global player_name
     player_name = "Anonymous"
 
+    #the board size and fleet to ask for, blank for the server's own
+    global requested_grid_size, requested_fleet
+    requested_grid_size = ""
+    requested_fleet = ""
+
     global enemy_name
     enemy_name = "Anonymous"
 
@@ -647,12 +757,18 @@ if __name__ == "__main__":
     global ships_placed
     ships_placed = asyncio.Event()
 
+    global server_socket, resume_token, match_code
+    server_socket = None
+    resume_token = None
+    match_code = None
+
     global ship_objs
     ship_objs = []
 
     global players_turn
     players_turn = True
 
+    ShipWarLog.setup_logging()
     pygame.init()
     
     global __SCREEN
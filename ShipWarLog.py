@@ -0,0 +1,88 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+#attributes every LogRecord has, anything else on a record was passed in through extra=
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime", "sampled"}
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as one line of key=value pairs, or one JSON object, including any fields passed with extra=
+    """
+    def __init__(self, as_json : bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record : logging.LogRecord) -> str:
+        fields = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+                  "level": record.levelname, "logger": record.name, "event": record.getMessage()}
+        fields.update((key, value) for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info: fields["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text: fields["exception"] = record.exc_text
+        if self.as_json: return json.dumps(fields, default=str)
+        return " ".join(f"{key}={json.dumps(value, default=str) if type(value) != str or ' ' in value or value == '' else value}" for key, value in fields.items())
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through only a fraction of the records logged with extra={"sampled": True}, so per-message logs stay cheap at full rate
+    """
+    def __init__(self, rate : float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record : logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False): return True
+        return self.rate >= 1 or random.random() < self.rate
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records for the background thread with their traceback kept apart from the message, so it still gets a field of its own.
+    The stock handler pastes it onto the end of the message
+    """
+    def prepare(self, record : logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        #the arguments and traceback are turned into text now, while they still mean what they did when the record was logged
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info: record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_listener : logging.handlers.QueueListener | None = None
+log_queue : queue.SimpleQueue = queue.SimpleQueue()
+
+def setup_logging(level : str | int | None = None, sample_rate : float | None = None, as_json : bool | None = None) -> None:
+    """
+    Sends every ShipWar log record through a queue to a background thread, which is the only thing that writes to stdout.
+    Defaults come from the SHIPWAR_LOG_LEVEL, SHIPWAR_LOG_SAMPLE and SHIPWAR_LOG_FORMAT environment variables
+    """
+    global _listener
+    if _listener != None: return
+
+    level = level if level != None else os.environ.get("SHIPWAR_LOG_LEVEL", "INFO").upper()
+    sample_rate = sample_rate if sample_rate != None else float(os.environ.get("SHIPWAR_LOG_SAMPLE", "0.01"))
+    as_json = as_json if as_json != None else os.environ.get("SHIPWAR_LOG_FORMAT", "text").lower() == "json"
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json))
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_rate))
+
+    logger = logging.getLogger("ShipWar")
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def get_logger(name : str) -> logging.Logger:
+    return logging.getLogger(f"ShipWar.{name}")
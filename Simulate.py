@@ -0,0 +1,121 @@
+import argparse
+import collections
+import itertools
+import multiprocessing
+import os
+import random
+import time
+import Bitboard
+import Server
+import Strategy
+
+class SimulationStats:
+    """
+    What happened over a batch of games, small enough to send back from a worker process and add to the others
+    """
+    def __init__(self):
+        self.games = 0
+        self.shots = 0
+        #games and wins against a different strategy, so mirror matches don't drag every win rate towards a half
+        self.games_against_others : collections.Counter[str] = collections.Counter()
+        self.wins_against_others : collections.Counter[str] = collections.Counter()
+        #strategy -> how many shots it took to win -> how many games that happened in
+        self.shots_to_win : dict[str, collections.Counter[int]] = collections.defaultdict(collections.Counter)
+
+    def add(self, other : "SimulationStats"):
+        self.games += other.games
+        self.shots += other.shots
+        self.games_against_others.update(other.games_against_others)
+        self.wins_against_others.update(other.wins_against_others)
+        for name, counts in other.shots_to_win.items(): self.shots_to_win[name].update(counts)
+
+def play_game(strategies : tuple[str, str], rng : random.Random, settings : Server.Settings = Server.DEFAULT_SETTINGS) -> tuple[int, list[int]]:
+    """
+    Plays one whole game in memory with the same rules as the server, returning the winner's index and how many shots each player took
+    """
+    match = Server.Match(0, settings=settings)
+    shooters = [Strategy.STRATEGIES[name](match.grid_size, list(match.fleet), rng) for name in strategies]
+    for player in range(Server.MAX_PLAYERS):
+        Server.ship_handling(match, player, {"type": "ships", "message": Bitboard.random_fleet(match.grid_size, match.fleet, rng)})
+
+    shots = [0, 0]
+    player = 0
+    while True:
+        position = shooters[player].next_shot()
+        result = Server.guess_result(match, {"type": "guess", "position": position}, player)
+        shots[player] += 1
+        sunk = Server.check_for_sinking(match, player) if result == 2 else None
+        if sunk == None: shooters[player].record(position, result)
+        else:
+            shooters[player].record_sunk(sunk)
+            if match.players_ships[1 - player].destroyed(): return player, shots
+        player = 1 - player
+
+def play_batch(strategies : tuple[str, str], games : int, seed : int, settings : Server.Settings = Server.DEFAULT_SETTINGS) -> SimulationStats:
+    stats = SimulationStats()
+    rng = random.Random(seed)
+    for game in range(games):
+        #the first player has an edge, so each strategy gets it in every other game
+        seats = strategies if game % 2 == 0 else strategies[::-1]
+        winner, shots = play_game(seats, rng, settings)
+        stats.games += 1
+        stats.shots += sum(shots)
+        stats.shots_to_win[seats[winner]][shots[winner]] += 1
+        if seats[0] != seats[1]:
+            stats.games_against_others.update(seats)
+            stats.wins_against_others[seats[winner]] += 1
+    return stats
+
+def _play_batch(arguments : tuple[tuple[str, str], int, int, Server.Settings]) -> SimulationStats:
+    return play_batch(*arguments)
+
+def simulate(strategies : list[str], games : int, workers : int, batch_size : int = 500, seed : int = 0,
+             settings : Server.Settings = Server.DEFAULT_SETTINGS) -> SimulationStats:
+    """
+    Plays the given number of games for every pairing of the strategies, themselves included, spread over a pool of worker processes
+    """
+    batches = []
+    for number, pairing in enumerate(itertools.combinations_with_replacement(strategies, 2)):
+        for start in range(0, games, batch_size):
+            #each batch gets its own seed, so a run can be repeated exactly whatever the number of workers
+            batches.append((pairing, min(batch_size, games - start), seed * 1_000_003 + number * 100_003 + start, settings))
+
+    stats = SimulationStats()
+    if workers <= 1:
+        for batch in batches: stats.add(_play_batch(batch))
+        return stats
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        for batch_stats in pool.imap_unordered(_play_batch, batches): stats.add(batch_stats)
+    return stats
+
+def report(stats : SimulationStats, elapsed : float):
+    print(f"Games: {stats.games} in {elapsed:.2f}s ({stats.games / elapsed:.0f}/s, {stats.games / elapsed * 3600:,.0f}/hour), {stats.shots / elapsed:,.0f} shots/s")
+    for name, counts in sorted(stats.shots_to_win.items()):
+        shots = sorted(counts.elements())
+        average = sum(shots) / len(shots)
+        print(f"{name}:")
+        if stats.games_against_others[name]:
+            print(f"  win rate against other strategies: {stats.wins_against_others[name] / stats.games_against_others[name]:.1%} of {stats.games_against_others[name]} games")
+        print(f"  shots to win: mean {average:.1f}, min {shots[0]}, p10 {shots[len(shots) // 10]}, p50 {shots[len(shots) // 2]}, p90 {shots[len(shots) * 9 // 10]}, max {shots[-1]}")
+        #a row of the distribution for every 5 shots, scaled to the busiest row
+        buckets = collections.Counter(count // 5 * 5 for count in shots)
+        widest = max(buckets.values())
+        for bucket in range(min(buckets), max(buckets) + 1, 5):
+            print(f"  {bucket:>3}-{bucket + 4:<3} {'#' * round(40 * buckets[bucket] / widest)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play lots of games between bot strategies in memory, with the server's rules, and report how each did")
+    parser.add_argument("--strategies", nargs="+", choices=list(Strategy.STRATEGIES), default=list(Strategy.STRATEGIES))
+    parser.add_argument("--games", type=int, default=2000, help="how many games to play for each pairing of strategies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch", type=int, default=500, help="how many games a worker plays before sending back its results")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid", default=Server.DEFAULT_SETTINGS[0], help="how many cells across the board is")
+    parser.add_argument("--fleet", default=",".join(map(str, Server.DEFAULT_SETTINGS[1])), help="the length of each ship, separated by commas")
+    args = parser.parse_args()
+    try: settings = Server.parse_settings(args.grid, args.fleet)
+    except ValueError as e: parser.error(str(e))
+
+    start = time.perf_counter()
+    stats = simulate(args.strategies, args.games, args.workers, args.batch, args.seed, settings)
+    report(stats, time.perf_counter() - start)
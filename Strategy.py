@@ -0,0 +1,128 @@
+import functools
+import random
+import Bitboard
+
+#numpy makes the heatmap much faster, but everything still works without it
+try: import numpy
+except ImportError: numpy = None
+
+#how much more a placement counts for every known hit it would explain
+HIT_WEIGHT = 25
+#the heatmap looks at every placement of every ship for every shot, which past this is too slow to keep up with a player
+HEATMAP_MAX_GRID = 20
+#boards up to this many cells are shuffled up front, bigger ones are shot at random until half of them are gone
+RANDOM_SHUFFLE_MAX_CELLS = 10_000
+
+class RandomStrategy:
+    """
+    Fires at every cell once, in a random order. On a huge board cells are picked as they're needed rather than shuffled up front,
+    so it costs no more than the shots actually fired
+    """
+    name = "random"
+
+    def __init__(self, grid_size : int = Bitboard.GRID_SIZE, fleet : list[int] = Bitboard.FLEET, rng : random.Random = random):
+        self.grid_size = grid_size
+        self.rng = rng
+        self.fired : set[int] = set()
+        #the cells left to shoot in the order they'll be shot, once there are few enough of them to shuffle
+        self.remaining : list[int] | None = None
+
+    def next_shot(self) -> list[int] | None:
+        cells = self.grid_size * self.grid_size
+        #picking at random stops paying off once most of the board has been shot, it keeps landing on old shots
+        if self.remaining == None and (cells <= RANDOM_SHUFFLE_MAX_CELLS or len(self.fired) * 2 >= cells):
+            self.remaining = [index for index in range(cells) if index not in self.fired]
+            self.rng.shuffle(self.remaining)
+        if self.remaining != None:
+            if not self.remaining: return None
+            index = self.remaining.pop()
+        else:
+            while (index := self.rng.randrange(cells)) in self.fired: pass
+        self.fired.add(index)
+        return list(divmod(index, self.grid_size))
+
+    def record(self, position : list[int], result : int): pass
+    def record_sunk(self, cells : list[list[int]]): pass
+
+class HeatmapStrategy:
+    """
+    Fires at the cell the most placements of the ships still afloat could cover, given every hit and miss so far.
+    Placements over a hit that hasn't sunk anything yet count many times over, so it finishes off ships it has found
+    """
+    name = "heatmap"
+
+    def __init__(self, grid_size : int = Bitboard.GRID_SIZE, fleet : list[int] = Bitboard.FLEET, rng : random.Random = random):
+        self.grid_size = grid_size
+        self.remaining = list(fleet)
+        #every length the fleet started with, so the same placements serve the whole game as ships sink
+        self.lengths = tuple(sorted(set(fleet)))
+        self.rng = rng
+        #hits on ships that haven't sunk yet, misses, and the cells of sunk ships, as masks like Bitboard.Board's
+        self.hits = 0
+        self.misses = 0
+        self.sunk = 0
+
+    def record(self, position : list[int], result : int):
+        bit = 1 << Bitboard.cell_index(position, self.grid_size)
+        if result == 1: self.misses |= bit
+        elif result == 2: self.hits |= bit
+        #a server that can't send whole ships says which cells sank one at a time
+        elif result == 3: self.sunk |= bit
+
+    def record_sunk(self, cells : list[list[int]]):
+        ship_mask = sum(1 << Bitboard.cell_index(cell, self.grid_size) for cell in cells)
+        self.hits &= ~ship_mask
+        self.sunk |= ship_mask
+        if len(cells) in self.remaining: self.remaining.remove(len(cells))
+
+    def next_shot(self) -> list[int] | None:
+        shot = self.hits | self.misses | self.sunk
+        if shot == (1 << self.grid_size * self.grid_size) - 1: return None
+        if numpy != None: index = self._pick_numpy(shot)
+        else: index = self._pick(shot)
+        return list(divmod(index, self.grid_size))
+
+    def _pick(self, shot : int) -> int:
+        counts = [0] * (self.grid_size * self.grid_size)
+        blocked = self.misses | self.sunk
+        for length in self.remaining:
+            for ship_mask, cells in Bitboard.placements(length, self.grid_size):
+                if ship_mask & blocked: continue
+                weight = 1 + HIT_WEIGHT * (ship_mask & self.hits).bit_count()
+                for cell in cells: counts[cell] += weight
+        best = max(count for index, count in enumerate(counts) if not shot >> index & 1)
+        return self.rng.choice([index for index, count in enumerate(counts) if count == best and not shot >> index & 1])
+
+    def _pick_numpy(self, shot : int) -> int:
+        grid_size = self.grid_size
+        matrix, lengths = _placement_matrix(self.lengths, grid_size)
+        #every placement at once: it's free if it covers nothing blocked, and worth more for every hit it covers.
+        #each length counts once per ship of it still afloat, so the rows for lengths that have all sunk count for nothing
+        #both counts come out of one pass over the matrix, which is most of the work on a big board
+        blocked, hits = (matrix @ numpy.stack([_cells(self.misses | self.sunk, grid_size), _cells(self.hits, grid_size)], axis=1)).T
+        afloat = numpy.bincount(self.remaining, minlength=self.lengths[-1] + 1)[lengths]
+        weights = ((blocked == 0) * (1 + HIT_WEIGHT * hits) * afloat).astype(numpy.float32)
+        #then each cell gets the weight of every placement that covers it
+        counts = weights @ matrix
+        counts[_cells(shot, grid_size).astype(bool)] = -1
+        best = numpy.flatnonzero(counts == counts.max())
+        return int(best[self.rng.randrange(len(best))])
+
+#one entry per fleet and board size being played, each at most a few MB at HEATMAP_MAX_GRID
+@functools.lru_cache(maxsize=16)
+def _placement_matrix(lengths : tuple[int, ...], grid_size : int):
+    """
+    One row per placement of a ship of any of the lengths, with a 1 in each cell it covers, and the length each row is for
+    """
+    rows = [(length, cells) for length in lengths for ship_mask, cells in Bitboard.placements(length, grid_size)]
+    matrix = numpy.zeros((len(rows), grid_size * grid_size), dtype=numpy.uint8)
+    for row, (length, cells) in enumerate(rows): matrix[row, list(cells)] = 1
+    return matrix, numpy.array([length for length, cells in rows], dtype=numpy.intp)
+
+def _cells(mask : int, grid_size : int):
+    cells = grid_size * grid_size
+    bits = numpy.unpackbits(numpy.frombuffer(mask.to_bytes((cells + 7) // 8, "little"), dtype=numpy.uint8), bitorder="little")
+    #numpy widens the placement matrix to this for every product, and float32 is half the work of float64
+    return bits[:cells].astype(numpy.float32)
+
+STRATEGIES = {strategy.name: strategy for strategy in (RandomStrategy, HeatmapStrategy)}
@@ -1,9 +1,17 @@
 import pygame
 import abc
+import collections
 
 global SCREEN
 SCREEN = None
 
+#(font file, size) -> the loaded font, for the window size they were loaded at. Sizes are scaled to the window, so a resize makes them all stale
+_fonts : dict[tuple[str, int], pygame.font.Font] = {}
+_fonts_window_size : tuple[int, int] = None
+#(text, font file, size, color) -> the text rendered in that font, the least recently used ones go first once there are too many
+TEXT_CACHE_SIZE = 512
+_rendered_text : collections.OrderedDict[tuple, pygame.Surface] = collections.OrderedDict()
+
 def get_scaled_size(base_size : int, min_size : int = 1, max_size : int = None, scale_reference = (1280, 700), current_size : tuple[int, int] = None) -> int | float:
     global SCREEN
     current_size = current_size if current_size else SCREEN.get_size()
@@ -13,16 +21,49 @@ def get_scaled_size(base_size : int, min_size : int = 1, max_size : int = None,
     if type(base_size) is int: return round(scaled_size)
     else: return scaled_size
 
+def get_font(font_type : str, size : int) -> pygame.font.Font:
+    """
+    Gets a font, only loading it from its file the first time each size is asked for since the window was last resized
+    """
+    global _fonts_window_size
+    window_size = SCREEN.get_size() if SCREEN else None
+    if window_size != _fonts_window_size:
+        clear_font_cache()
+        _fonts_window_size = window_size
+    try: return _fonts[(font_type, size)]
+    except KeyError:
+        font = _fonts[(font_type, size)] = pygame.font.Font(font_type, size)
+        return font
+
+def clear_font_cache() -> None:
+    _fonts.clear()
+
+def render_text(text : str, font_type : str, size : int, color : str | list[int, int, int]) -> pygame.Surface:
+    """
+    Renders text, or gets it from the last time the same text was rendered in the same font, size and color.
+    Everything shares the surfaces it returns, so they must only ever be drawn from and not onto
+    """
+    key = (text, font_type, size, color if type(color) is str else tuple(color))
+    try:
+        _rendered_text.move_to_end(key)
+        return _rendered_text[key]
+    except KeyError:
+        surface = _rendered_text[key] = get_font(font_type, size).render(text, True, color)
+        if len(_rendered_text) > TEXT_CACHE_SIZE: _rendered_text.popitem(last=False)
+        return surface
+
 def display_error_box(screen : pygame.Surface, error_message : str) -> None:
     scroll = TextArea(screen, [1000, 500], [0, 0],
                                         error_message
                                         , padding=[15, 15])
 
+    ok_button = Button(screen, "OK", 10, [0, 0], "blue")
+
     while True:
         screen.fill("black")
         scroll.center=[screen.get_width() // 2, screen.get_height() // 2]
         scroll.draw()
-        ok_button = Button(screen, "OK", 10, [scroll.center[0], scroll.rect.bottom + get_scaled_size(25)], "blue")
+        ok_button.center = [scroll.center[0], scroll.rect.bottom + get_scaled_size(25)]
         ok_button.draw()
 
         for event in pygame.event.get():
@@ -117,14 +158,14 @@ class Text(Widget):
         except: return None
     @font_type.setter
     def font_type(self, value : str):
-        pygame.font.Font(value, self.font_size)
+        get_font(value, self.font_size)
         self.__font_type = value
         if not self._block_calc: self._calc_surface()
 
     @property
     def font(self) -> pygame.font.Font:
-        try: return pygame.font.Font(self.font_type, get_scaled_size(self.font_size))
-        except: return pygame.font.Font()
+        try: return get_font(self.font_type, get_scaled_size(self.font_size))
+        except: return get_font(None, 12)
     @font.setter
     def font(self, value : pygame.font.Font):
         raise AttributeError("You must edit font_size, and font_type seperatly")
@@ -141,7 +182,8 @@ class Text(Widget):
         self.__padding = list(value)
 
     def _calc_surface(self):
-        self.surface = self.font.render(self.inner_text, True, self.color)
+        try: self.surface = render_text(self.inner_text, self.font_type, get_scaled_size(self.font_size), self.color)
+        except: self.surface = self.font.render(self.inner_text, True, self.color)
         self._calc_rect()
     
     def _calc_rect(self):
@@ -214,7 +256,7 @@ class TextArea(Widget):
         
     @property
     def font(self):
-        return pygame.font.Font(self.font_type, get_scaled_size(self.font_size))
+        return get_font(self.font_type, get_scaled_size(self.font_size))
     @font.setter
     def font(self, value):
         raise AttributeError("You need to edit the font_type and font_size seperately")
@@ -308,7 +350,7 @@ class TextArea(Widget):
     @font_type.setter
     def font_type(self, value : str):
         if type(value) not in [str, None]: raise TypeError("The font_type must be a string, or 'None'")
-        try: pygame.font.Font(value, self.font_size)
+        try: get_font(value, self.font_size)
         except: raise AttributeError("Font type invalid")
         self.__font_type = value
         if not self._block_calcs: self._calc_wrap_text()
@@ -659,10 +701,69 @@ class EntryField(Widget):
             self.input.inner_text = self.input.inner_text[:self.cursor.index] + event.unicode + self.input.inner_text[self.cursor.index:]
             self.cursor.index += 1
 
+class Grid(Widget):
+    """
+    A board of square cells with a title above it and labels beside it, drawn once onto a surface of its own so that drawing it each frame is a single blit.
+    Where each cell is comes from the position of the first one and the cell size
+    """
+    def __init__(self, screen : pygame.Surface, title_center : list[int, int], cell_size : int, cells : int, title : str = "",
+                 row_labels : list[str] = [], col_labels : list[str] = [], font_size : int = 24, label_gap : int = 0,
+                 border_color : str | list[int, int, int] = (100, 100, 100)):
+        self.screen = screen
+        self.title_center = title_center
+        self.cell_size = cell_size
+        self.cells = cells
+        self.title = title
+        self.row_labels = row_labels
+        self.col_labels = col_labels
+        self.font_size = font_size
+        self.label_gap = label_gap
+        self.border_color = border_color
+
+        self._calc_rect()
+
+    def _calc_rect(self):
+        grid_px = self.cell_size * self.cells
+        title_text = Text(self.screen, self.title, self.title_center, font_size=self.font_size)
+        #the cells start a title's height below the title
+        self.origin = [self.title_center[0] - grid_px // 2, title_text.rect.bottom + title_text.rect.height]
+        self.grid_rect = pygame.Rect(self.origin, (grid_px, grid_px))
+
+        texts = [title_text]
+        texts += [Text(self.screen, label, [self.origin[0] - self.label_gap, self.origin[1] + (i + 0.5) * self.cell_size]) for i, label in enumerate(self.row_labels)]
+        texts += [Text(self.screen, label, [self.origin[0] + (i + 0.5) * self.cell_size, self.origin[1] - self.label_gap]) for i, label in enumerate(self.col_labels)]
+        self.rect = self.grid_rect.unionall([text.rect for text in texts])
+        self._calc_surface(texts)
+
+    def _calc_surface(self, texts : list[Text]):
+        self.surface = pygame.Surface(self.rect.size)
+        offset = (-self.rect.left, -self.rect.top)
+        for text in texts: self.surface.blit(text.surface, text.rect.move(offset))
+        for row in range(self.cells):
+            for col in range(self.cells):
+                pygame.draw.rect(self.surface, self.border_color, self.cell_rect(row, col).move(offset), 1)
+
+    def cell_rect(self, row : int, col : int) -> pygame.Rect:
+        return pygame.Rect(self.origin[0] + col * self.cell_size, self.origin[1] + row * self.cell_size, self.cell_size, self.cell_size)
+
+    def cell_at(self, pos : tuple[int, int]) -> tuple[int, int] | None:
+        """
+        Gets the (row, col) of the cell under a point, or None if it isn't on a cell
+        """
+        col, row = (pos[0] - self.origin[0]) // self.cell_size, (pos[1] - self.origin[1]) // self.cell_size
+        if 0 <= row < self.cells and 0 <= col < self.cells: return (int(row), int(col))
+        return None
+
+    def cell_center(self, row : int, col : int) -> tuple[int, int]:
+        return (self.origin[0] + col * self.cell_size + self.cell_size // 2, self.origin[1] + row * self.cell_size + self.cell_size // 2)
+
+    def draw(self):
+        self.screen.blit(self.surface, self.rect)
+
 class Ship(Widget):
     def __init__(self, screen : pygame.surface, top_left : list[int, int], cell_size : int, 
                  dimensions : list[int, int], alive_color : list[int, int, int] = "blue", dead_color : list[int, int, int] = "grey",
-                 grid_origin : list[int, int] = [0, 0]):
+                 grid_origin : list[int, int] = [0, 0], view_origin : list[int, int] | None = None):
         self.screen = screen
         self.top_left = top_left
         self.cell_size = cell_size
@@ -670,6 +771,8 @@ class Ship(Widget):
         self.alive_color = alive_color
         self.dead_color = dead_color
         self.grid_origin = grid_origin
+        #the row and column of the board in the grid's top left corner when the ship was put down on it, None until it has been
+        self.view_origin = view_origin
 
         self.being_held = False
         self.alive = True
@@ -726,6 +829,16 @@ class Ship(Widget):
                 self.top_left = [mouse_pos[0] - self.__mouse_left_top_diff[0], mouse_pos[1] - self.__mouse_left_top_diff[1]]
         except: self.__mouse_left_top_diff = new_diff
     
+    def move_view(self, view_origin : list[int, int]):
+        """
+        Keeps a ship that's been put down on the same cells of the board when the board scrolls to show view_origin in its top left
+        """
+        if self.view_origin == None or self.being_held or self.view_origin == view_origin: return False
+        self.top_left = [self.top_left[0] - (view_origin[1] - self.view_origin[1]) * self.cell_size,
+                         self.top_left[1] - (view_origin[0] - self.view_origin[0]) * self.cell_size]
+        self.view_origin = list(view_origin)
+        return True
+
     def rotate(self, event : pygame.event.Event):
         if not self.being_held or event.type != pygame.KEYDOWN or event.key != pygame.K_r: return False
         self.dimensions = [self.dimensions[1], self.dimensions[0] * -1]
\ No newline at end of file